@@ -6,6 +6,10 @@ from functools import reduce
 
 STATE = TypeVar('STATE')
 
+# the symbol that stands for every character an automaton's alphabet does not name;
+# negated classes move on it, and any other character read is matched as OTHER
+OTHER = '<other>'
+
 @dataclass
 class DFA[STATE]:
     S: set[str]
@@ -13,84 +17,186 @@ class DFA[STATE]:
     q0: STATE
     d: dict[tuple[STATE, str], STATE]
     F: set[STATE]
-    
+
+    def dead_states(self) -> set[STATE]:
+        # states from which no final state can be reached; the DFA is a plain record
+        # that may be filled in after construction, so the matchers compiled from it
+        # compute this once when they are built
+        # index the transitions backwards: target -> set of sources
+        reverse = {}
+        for (s, _), nxt in self.d.items():
+            reverse.setdefault(nxt, set()).add(s)
+        # walk backwards from the final states to find every co-accessible state
+        alive = set(self.F)
+        stack = list(self.F)
+        while stack:
+            current = stack.pop()
+            for prev in reverse.get(current, ()):
+                if prev not in alive:
+                    alive.add(prev)
+                    stack.append(prev)
+        # everything else can never lead to acceptance
+        return self.K - alive
+
+    def trim(self) -> tuple['DFA[STATE]', int]:
+        # keep only the states that are reachable from q0 and can still reach a final
+        # state (q0 always stays), returns the pruned DFA and how many states were removed;
+        # transitions into removed states are dropped, so the result may be partial
+        reachable = {self.q0}
+        stack = [self.q0]
+        while stack:
+            current = stack.pop()
+            for c in self.S:
+                nxt = self.d.get((current, c))
+                if nxt is not None and nxt not in reachable:
+                    reachable.add(nxt)
+                    stack.append(nxt)
+        keep = (reachable - self.dead_states()) | {self.q0}
+        new_d = {(s, c): nxt for (s, c), nxt in self.d.items() if s in keep and nxt in keep}
+        trimmed = DFA(S=self.S, K=keep, q0=self.q0, d=new_d, F=self.F & keep)
+        return trimmed, len(self.K) - len(keep)
 
     def accept(self, word: str) -> bool:
         # begin by setting final state to the starting state
         final_state = self.q0
-        # while word was not processed
-        while(word):
-            # extract character and rest of the word
-            a, word = word[0], word[1:]
+        # a walk longer than the number of states goes round a cycle; only then is
+        # the dead set computed, so short words never pay for it
+        dead = None
+        steps = len(self.K)
+        # go through the word one character at a time (no slicing, so this stays linear)
+        for a in word:
+            # characters the alphabet does not name are read as OTHER
+            if a not in self.S:
+                a = OTHER
             # if there is no transition from the current state and character return false
             if((final_state, a) not in self.d):
                 return False
             # make the transition
             final_state = self.d[(final_state, a)]
+            # once in a dead state no suffix can lead to acceptance
+            if dead is None:
+                steps -= 1
+                if steps < 0:
+                    dead = self.dead_states()
+            if dead is not None and final_state in dead:
+                return False
         return final_state in self.F
 
-    def minimize(self) -> 'DFA[STATE]':
-       # check if there exists final states and create the W and P lists
-       if self.F:
-           W = [set(self.F)]
-           P = [set(self.F)]
-       else:
-           W = []
-           P = []
-       # non final states is the difference between all states and the final ones
-       non_final = self.K - self.F
-       # add the non_final states to both lists
-       if non_final:
-           W.append(set(non_final))
-           P.append(set(non_final))
-       # while partitions exist in Working set
-       while W:
-           # pop a partition into Q
-           Q = W.pop()
-           # for all characters in the alphabet
-           for c in self.S:
-               # X is the set of all states that have a transition on char c in partition Q
-               X = set()
-               for s in self.K:
-                   if self.d.get((s,c),None) in Q:
-                       X.add(s)
-               # update P and W
-               new_P = []
-               new_W = []
-               # for all partitions in P
-               for R in P:
-                   # this checks if that partition has states that behave differently on the same character
-                   if R & X and R-X:
-                       # states that go to Q
-                       R1 = set(R & X)
-                       # state that don't go to Q
-                       R2 = set(R - X)
-                       # add them to the new_P
-                       new_P.append(R1)
-                       new_P.append(R2)
-                       # if R is already in W, add both R1 and R2 else add the smaller split
-                       if R in W:
-                           new_W.append(R1)
-                           new_W.append(R2)
-                       elif len(R1)<=len(R2):
-                           new_W.append(R1)
-                       else:
-                           new_W.append(R2)
-                   else:
-                       new_P.append(R)
-                #update P  and extend W with new_W
-               P = new_P
-               W.extend(new_W)
-        # After creating the partitions, create the new minimized DFA
-       state_to_group = {}
-       # For all blocks and their index
-       for i, block in enumerate(P):
-           # go through each state in block and assign the state to the index of the group
-           for s in block:
-               state_to_group[s] = i
+    def minimize(self, key: Callable[[STATE], object] | None = None,
+                 groups: dict[STATE, int] | None = None) -> 'DFA[STATE]':
+        # Hopcroft's algorithm in O(|S| * |K| * log |K|): the partition lives in
+        # arrays and blocks are split in place, the splitters are found through an
+        # inverse transition index and the worklist has O(1) membership checks.
+        # States with a different key(state) are never merged, which keeps data
+        # attached to the states (like token tags) valid in the minimized DFA;
+        # groups, if given, is filled with the new state of every old one
+        states = list(self.K)
+        index = {s: i for i, s in enumerate(states)}
+        symbols = list(self.S)
+        n = len(states)
+        # a missing transition goes to an implicit non-final sink state with index n
+        sink = n
+        size = n + 1
+
+        # inverse[c][t] = the states that go to t on the c-th symbol
+        inverse = [{} for _ in symbols]
+        for c, symbol in enumerate(symbols):
+            for s in range(size):
+                nxt = self.d.get((states[s], symbol)) if s < n else None
+                inverse[c].setdefault(index.get(nxt, sink), []).append(s)
+
+        # initial partition: final and non-final states, further split by key;
+        # the sink gets a block of its own when there is a key
+        initial = {}
+        for s in range(size):
+            if s == sink:
+                label = (False, key is not None)
+            else:
+                label = (states[s] in self.F, key(states[s]) if key is not None else None)
+            initial.setdefault(label, []).append(s)
+        blocks = list(initial.values())
+
+        # refinable partition: the states of block b are elements[start[b]:end[b]],
+        # location[s] is the position of s in elements
+        elements = [s for block in blocks for s in block]
+        location = [0] * size
+        for i, s in enumerate(elements):
+            location[s] = i
+        block_of = [0] * size
+        start = []
+        end = []
+        for block in blocks:
+            b = len(start)
+            start.append(location[block[0]])
+            end.append(location[block[0]] + len(block))
+            for s in block:
+                block_of[s] = b
+        # marked[b] counts the marked states, kept at the front of the block
+        marked = [0] * len(start)
+
+        # worklist of (block, symbol) splitters; every initial block but the largest
+        # one is enough since the last one is implied by the others
+        largest = max(range(len(start)), key=lambda b: end[b] - start[b])
+        worklist = [(b, c) for b in range(len(start)) if b != largest for c in range(len(symbols))]
+        waiting = set(worklist)
+
+        while worklist:
+            splitter = worklist.pop()
+            waiting.discard(splitter)
+            b, c = splitter
+            # mark every state that goes into block b on symbol c
+            touched = []
+            for t in elements[start[b]:end[b]]:
+                for s in inverse[c].get(t, ()):
+                    block = block_of[s]
+                    i = location[s]
+                    j = start[block] + marked[block]
+                    if i < j:
+                        # already marked
+                        continue
+                    # swap s to the end of the marked prefix of its block
+                    other = elements[j]
+                    elements[i], elements[j] = other, s
+                    location[other], location[s] = i, j
+                    if marked[block] == 0:
+                        touched.append(block)
+                    marked[block] += 1
+            # split every touched block into its marked and unmarked parts
+            for block in touched:
+                count = marked[block]
+                marked[block] = 0
+                if count == end[block] - start[block]:
+                    continue
+                # the marked prefix becomes a new block
+                new_block = len(start)
+                start.append(start[block])
+                end.append(start[block] + count)
+                marked.append(0)
+                start[block] += count
+                for i in range(start[new_block], end[new_block]):
+                    block_of[elements[i]] = new_block
+                # if the old block is still waiting both halves must be processed,
+                # otherwise the smaller half is enough
+                smaller = new_block if count <= end[block] - start[block] else block
+                for symbol in range(len(symbols)):
+                    if (block, symbol) in waiting:
+                        pending = (new_block, symbol)
+                    else:
+                        pending = (smaller, symbol)
+                    worklist.append(pending)
+                    waiting.add(pending)
+
+        # After creating the partitions, number the groups of the real states
+        state_to_group = {}
+        group_of_block = {}
+        for s in range(n):
+            group = group_of_block.setdefault(block_of[s], len(group_of_block))
+            state_to_group[states[s]] = group
+        if groups is not None:
+            groups.update(state_to_group)
         # then call remap_states
-       return self.remap_states(lambda s: state_to_group[s])
-        
+        return self.remap_states(lambda s: state_to_group[s])
+
     def remap_states[OTHER_STATE](self, f: Callable[[STATE], 'OTHER_STATE']) -> 'DFA[OTHER_STATE]':
         new_K = {f(s) for s in self.K}
         new_q0 = f(self.q0)
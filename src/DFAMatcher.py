@@ -0,0 +1,82 @@
+from array import array
+from collections.abc import Iterable
+
+from .DFA import DFA
+from .SymbolClasses import SymbolClasses
+
+
+class DFAMatcher:
+    # A DFA compiled into flat tables: states are 0..n-1 (0 is the initial state),
+    # characters that behave the same in every state share one symbol class, and
+    # table[state * width + symbol_class] is the next state or -1 when the DFA is
+    # stuck (no transition, or a transition into a dead state).
+    # A DFA whose alphabet is already made of class ids is compiled with the
+    # SymbolClasses it was built over, and then uses those ids as columns.
+    def __init__(self, dfa: DFA, symbols: SymbolClasses | None = None) -> None:
+        alphabet = sorted(dfa.S)
+        dead = dfa.dead_states()
+        # number the reachable states that can still lead to acceptance in BFS order
+        live = [dfa.q0]
+        number = {dfa.q0: 0}
+        for s in live:
+            for c in alphabet:
+                nxt = dfa.d.get((s, c))
+                if nxt is not None and nxt not in number and nxt not in dead:
+                    number[nxt] = len(live)
+                    live.append(nxt)
+        # DFA state -> matcher state, for callers that attach data to the states
+        self.number = number
+
+        if symbols is None:
+            # the column of a character is the tuple of its targets from every state;
+            # characters with equal columns are interchangeable
+            columns = {}
+            for c in alphabet:
+                column = tuple(number.get(dfa.d.get((s, c)), -1) for s in live)
+                columns.setdefault(column, []).append(c)
+            symbols = SymbolClasses(columns.values())
+            column_of = {c: cls for cls, chars in enumerate(symbols.members) for c in chars}
+        else:
+            column_of = {cls: cls for cls in alphabet}
+        self.symbols = symbols
+        # one extra class for characters outside the alphabet, which always fail
+        self.width = len(symbols) + 1
+        self.table = array('i', [-1]) * (len(live) * self.width)
+        for state, s in enumerate(live):
+            for c in alphabet:
+                target = number.get(dfa.d.get((s, c)), -1)
+                self.table[state * self.width + column_of[c]] = target
+        self.accepting = bytearray(1 if s in dfa.F else 0 for s in live)
+        self.states = len(live)
+
+    def encode(self, word: str) -> bytes | list[int]:
+        return self.symbols.encode(word)
+
+    def accept(self, word: str) -> bool:
+        table, width = self.table, self.width
+        state = 0
+        for cls in self.encode(word):
+            state = table[state * width + cls]
+            if state < 0:
+                return False
+        return bool(self.accepting[state])
+
+    def match_prefix(self, word: str, start: int = 0) -> int:
+        # end of the longest accepted prefix of word[start:], or -1 if there is none;
+        # characters are classified one by one so the scan stops as soon as it is stuck
+        table, width, accepting = self.table, self.width, self.accepting
+        classes = self.symbols.map
+        other = classes.other
+        state = 0
+        last_accept = start if accepting[0] else -1
+        for i in range(start, len(word)):
+            state = table[state * width + classes.get(ord(word[i]), other)]
+            if state < 0:
+                break
+            if accepting[state]:
+                last_accept = i + 1
+        return last_accept
+
+    def accept_many(self, words: Iterable[str]) -> list[bool]:
+        accept = self.accept
+        return [accept(word) for word in words]
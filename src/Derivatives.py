@@ -0,0 +1,305 @@
+from collections.abc import Callable, Iterable
+
+from .Regex import Regex, Kleene, Optional, Plus, Concat, Union, Character, CharClass, EPSILON, chain_parts, postorder
+
+# kinds of terms; a term is stored as (kind, *arguments) and known by its id
+EMPTY_KIND = 'empty'  # matches nothing
+EPS_KIND = 'eps'      # matches only the empty word
+CHARS_KIND = 'chars'  # one character out of a set
+OTHER_CHARS_KIND = 'other chars'  # one character outside a set
+CAT_KIND = 'cat'      # concatenation, always nested to the right
+ALT_KIND = 'alt'      # union of a set of terms
+AND_KIND = 'and'      # intersection of a set of terms
+STAR_KIND = 'star'
+NOT_KIND = 'not'      # complement
+
+
+def bottom_up(root: int, parts: Callable[[int], tuple[int, ...]], combine: Callable[[int, dict], int]) -> int:
+    # computes combine(t, results) for root with an explicit stack, after every term
+    # parts() leads to; results maps the terms done so far to what combine returned,
+    # so a term shared by several others is only combined once
+    results = {}
+    stack = [root]
+    while stack:
+        t = stack[-1]
+        if t in results:
+            stack.pop()
+            continue
+        pending = [u for u in parts(t) if u not in results]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        results[t] = combine(t, results)
+    return results[root]
+
+
+class TermTable:
+    # Hash-consed regex terms: every distinct term is stored once and known by an int
+    # id, so equal terms have equal ids and comparing or hashing a term is O(1).
+    # Terms are only built through the smart constructors below, which apply the
+    # simplifications that keep the set of derivatives of a regex finite:
+    # associativity, commutativity and idempotence of alt/and, the units and zeros
+    # of every operator, and r** = r*, ~~r = r
+    def __init__(self) -> None:
+        self.ids = {}
+        self.terms = []
+        self.nullable_memo = []
+        self.empty = self.intern((EMPTY_KIND,), False)
+        self.eps = self.intern((EPS_KIND,), True)
+        # ~empty matches every word
+        self.everything = self.intern((NOT_KIND, self.empty), True)
+
+    def intern(self, term: tuple, nullable: bool) -> int:
+        t = self.ids.get(term)
+        if t is None:
+            t = len(self.terms)
+            self.ids[term] = t
+            self.terms.append(term)
+            self.nullable_memo.append(nullable)
+        return t
+
+    def nullable(self, t: int) -> bool:
+        return self.nullable_memo[t]
+
+    def chars(self, chars: Iterable[str]) -> int:
+        chars = frozenset(chars)
+        if not chars:
+            return self.empty
+        return self.intern((CHARS_KIND, chars), False)
+
+    def other_chars(self, excluded: Iterable[str]) -> int:
+        return self.intern((OTHER_CHARS_KIND, frozenset(excluded)), False)
+
+    def cat(self, a: int, b: int) -> int:
+        if a == self.empty or b == self.empty:
+            return self.empty
+        if a == self.eps:
+            return b
+        if b == self.eps:
+            return a
+        # (x y) b = x (y b): walk down the chain of a and rebuild it on top of b
+        heads = []
+        while self.terms[a][0] == CAT_KIND:
+            heads.append(self.terms[a][1])
+            a = self.terms[a][2]
+        heads.append(a)
+        result = b
+        for head in reversed(heads):
+            result = self.intern((CAT_KIND, head, result), self.nullable(head) and self.nullable(result))
+        return result
+
+    def alt(self, *ts: int) -> int:
+        members = set()
+        for t in ts:
+            term = self.terms[t]
+            if term[0] == ALT_KIND:
+                members |= term[1]
+            elif t != self.empty:
+                members.add(t)
+        if self.everything in members:
+            return self.everything
+        if not members:
+            return self.empty
+        if len(members) == 1:
+            return members.pop()
+        return self.intern((ALT_KIND, frozenset(members)), any(self.nullable(t) for t in members))
+
+    def both(self, *ts: int) -> int:
+        members = set()
+        for t in ts:
+            term = self.terms[t]
+            if term[0] == AND_KIND:
+                members |= term[1]
+            elif t != self.everything:
+                members.add(t)
+        if self.empty in members:
+            return self.empty
+        if not members:
+            return self.everything
+        if len(members) == 1:
+            return members.pop()
+        return self.intern((AND_KIND, frozenset(members)), all(self.nullable(t) for t in members))
+
+    def star(self, a: int) -> int:
+        if a == self.empty or a == self.eps:
+            return self.eps
+        if self.terms[a][0] == STAR_KIND:
+            return a
+        return self.intern((STAR_KIND, a), True)
+
+    def complement(self, a: int) -> int:
+        term = self.terms[a]
+        if term[0] == NOT_KIND:
+            return term[1]
+        return self.intern((NOT_KIND, a), not self.nullable(a))
+
+    def from_regex(self, regex: Regex) -> int:
+        # translate a parsed regex into a term, bottom-up; chains are taken whole,
+        # so a long concatenation is built from its end in linear time
+        return postorder(regex, chain_parts, self.from_node)
+
+    def from_node(self, regex: Regex, children: list[int]) -> int:
+        # the term of one regex node, given the terms of its children
+        if isinstance(regex, Character):
+            return self.eps if regex.c == EPSILON else self.chars(regex.c)
+        if isinstance(regex, CharClass):
+            return self.other_chars(regex.chars) if regex.negated else self.chars(regex.chars)
+        if isinstance(regex, Concat):
+            term = self.eps
+            for child in reversed(children):
+                term = self.cat(child, term)
+            return term
+        if isinstance(regex, Union):
+            return self.alt(*children)
+        if isinstance(regex, Kleene):
+            return self.star(children[0])
+        if isinstance(regex, Plus):
+            # r+ = r r*
+            return self.cat(children[0], self.star(children[0]))
+        if isinstance(regex, Optional):
+            return self.alt(self.eps, children[0])
+        raise TypeError(f'cannot take derivatives of {type(regex).__name__}')
+
+    def parts(self, t: int) -> tuple[int, ...]:
+        # the terms a term is made of
+        term = self.terms[t]
+        kind = term[0]
+        if kind == CAT_KIND:
+            return term[1], term[2]
+        if kind == ALT_KIND or kind == AND_KIND:
+            return tuple(term[1])
+        if kind == STAR_KIND or kind == NOT_KIND:
+            return term[1],
+        return ()
+
+    def derivative(self, t: int, c: str) -> int:
+        # the term matching { w | c w is matched by t }
+        def parts(u):
+            # the tail of a concatenation only matters after a nullable head
+            term = self.terms[u]
+            if term[0] == CAT_KIND and not self.nullable(term[1]):
+                return term[1],
+            return self.parts(u)
+
+        def derive(u, derivatives):
+            term = self.terms[u]
+            kind = term[0]
+            if kind == CHARS_KIND:
+                return self.eps if c in term[1] else self.empty
+            if kind == OTHER_CHARS_KIND:
+                return self.empty if c in term[1] else self.eps
+            if kind == CAT_KIND:
+                head, tail = term[1], term[2]
+                first = self.cat(derivatives[head], tail)
+                if self.nullable(head):
+                    return self.alt(first, derivatives[tail])
+                return first
+            if kind == ALT_KIND:
+                return self.alt(*(derivatives[v] for v in term[1]))
+            if kind == AND_KIND:
+                return self.both(*(derivatives[v] for v in term[1]))
+            if kind == STAR_KIND:
+                return self.cat(derivatives[term[1]], u)
+            if kind == NOT_KIND:
+                return self.complement(derivatives[term[1]])
+            # empty and eps
+            return self.empty
+
+        return bottom_up(t, parts, derive)
+
+
+class DerivativeMatcher:
+    # Matches a regex by taking Brzozowski derivatives: the state after reading a
+    # word is the derivative of the regex by that word, and the word is accepted
+    # when that state is nullable. Derivatives are memoized per (state, character),
+    # so the table fills up into a DFA as the input needs it and nothing is built
+    # up front; this pays off for patterns that are only matched a few times.
+    # The table is not bounded: the number of distinct derivatives is finite, but
+    # may be exponential in the size of the regex.
+    def __init__(self, start: int, table: TermTable | None = None) -> None:
+        self.table = table or TermTable()
+        self.start = start
+        # state -> {character: next state}
+        self.next = {}
+
+    @classmethod
+    def from_regex(cls, regex: Regex) -> 'DerivativeMatcher':
+        table = TermTable()
+        return cls(table.from_regex(regex), table)
+
+    def intersection(self, other: 'DerivativeMatcher') -> 'DerivativeMatcher':
+        # matches the words both matchers accept
+        return DerivativeMatcher(self.table.both(self.start, self.import_term(other)), self.table)
+
+    def complement(self) -> 'DerivativeMatcher':
+        # matches the words this matcher rejects
+        return DerivativeMatcher(self.table.complement(self.start), self.table)
+
+    def import_term(self, other: 'DerivativeMatcher') -> int:
+        # the start term of another matcher, rebuilt in this matcher's table
+        if other.table is self.table:
+            return other.start
+        table = self.table
+
+        def copy(t, copies):
+            term = other.table.terms[t]
+            kind = term[0]
+            if kind == EMPTY_KIND:
+                return table.empty
+            if kind == EPS_KIND:
+                return table.eps
+            if kind == CHARS_KIND:
+                return table.chars(term[1])
+            if kind == OTHER_CHARS_KIND:
+                return table.other_chars(term[1])
+            if kind == CAT_KIND:
+                return table.cat(copies[term[1]], copies[term[2]])
+            if kind == ALT_KIND:
+                return table.alt(*(copies[u] for u in term[1]))
+            if kind == AND_KIND:
+                return table.both(*(copies[u] for u in term[1]))
+            if kind == STAR_KIND:
+                return table.star(copies[term[1]])
+            return table.complement(copies[term[1]])
+        return bottom_up(other.start, other.table.parts, copy)
+
+    def step(self, state: int, c: str) -> int:
+        moves = self.next.get(state)
+        if moves is None:
+            moves = self.next[state] = {}
+        nxt = moves.get(c)
+        if nxt is None:
+            nxt = moves[c] = self.table.derivative(state, c)
+        return nxt
+
+    def accept(self, word: str) -> bool:
+        empty = self.table.empty
+        state = self.start
+        for c in word:
+            state = self.step(state, c)
+            if state == empty:
+                return False
+        return self.table.nullable(state)
+
+    def match_prefix(self, word: str, start: int = 0) -> int:
+        # end of the longest accepted prefix of word[start:], or -1 if there is none
+        table = self.table
+        state = self.start
+        last_accept = start if table.nullable(state) else -1
+        for i in range(start, len(word)):
+            state = self.step(state, word[i])
+            if state == table.empty:
+                break
+            if table.nullable(state):
+                last_accept = i + 1
+        return last_accept
+
+    def accept_many(self, words: Iterable[str]) -> list[bool]:
+        accept = self.accept
+        return [accept(word) for word in words]
+
+    @property
+    def states(self) -> int:
+        # how many derivatives have been built so far
+        return len(self.next)
@@ -0,0 +1,144 @@
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from .NFA import NFA, EPSILON, OTHER
+
+
+class LazyDFA:
+    # A DFA that is determinized on demand, in the style of RE2: a subset state is
+    # only built the first time a transition reaches it, and the cache of built
+    # states is bounded by max_states. When the cache is full it is flushed and
+    # filled again from the states that are actually in use, so exponential
+    # subset constructions never get materialized.
+    #
+    # States are small ints that stay valid until the next flush; step() always
+    # returns a valid id for the state it moves into. -1 means the automaton is
+    # stuck (no NFA state left that can still reach a final state).
+    def __init__(self, nfa: NFA, max_states: int = 10000,
+                 label: Callable[[frozenset], Any] | None = None) -> None:
+        if max_states < 2:
+            raise ValueError('a lazy DFA needs room for at least 2 states')
+        self.S = nfa.S
+        self.max_states = max_states
+        # optional per-state data, computed from the NFA subset when a state is built
+        self.label = label
+
+        # number the NFA states densely so subsets are int bitmasks
+        self.order = list(nfa.states())
+        bit = {s: i for i, s in enumerate(self.order)}
+        closures = nfa.epsilon_closures()
+        closure_mask = [0] * len(self.order)
+        for s, i in bit.items():
+            for t in closures[s]:
+                closure_mask[i] |= 1 << bit[t]
+        # only states that can still reach a final state are kept in a subset
+        trimmed, _ = nfa.trim()
+        self.live = 0
+        for s in trimmed.K:
+            self.live |= 1 << bit[s]
+        # moves[i][symbol] = epsilon-closed targets of the i-th NFA state
+        self.moves = [{} for _ in self.order]
+        for (s, symbol), nxt_set in nfa.d.items():
+            if symbol == EPSILON:
+                continue
+            mask = 0
+            for t in nxt_set:
+                mask |= closure_mask[bit[t]]
+            self.moves[bit[s]][symbol] = self.moves[bit[s]].get(symbol, 0) | mask
+        self.final = 0
+        for s in nfa.F:
+            self.final |= 1 << bit[s]
+        self.start_mask = closure_mask[bit[nfa.q0]] & self.live
+
+        # the cache, indexed by state; callers may keep references to these lists,
+        # a flush empties them in place
+        self.ids = {}
+        self.masks = []
+        self.next = []
+        self.accepting = []
+        self.labels = []
+        # number of times the cache was flushed
+        self.flushes = 0
+        self.flush()
+
+    def flush(self) -> None:
+        # drop every cached state and transition, only the start state is rebuilt
+        self.ids.clear()
+        self.masks.clear()
+        self.next.clear()
+        self.accepting.clear()
+        self.labels.clear()
+        self.start = self.add(self.start_mask)
+
+    def add(self, mask: int) -> int:
+        # build a new state for the given subset
+        state = len(self.masks)
+        self.ids[mask] = state
+        self.masks.append(mask)
+        self.next.append({})
+        self.accepting.append(bool(mask & self.final))
+        if self.label is not None:
+            self.labels.append(self.label(self.subset(state)))
+        return state
+
+    def subset(self, state: int) -> frozenset:
+        # the NFA states behind a DFA state, for labels and debugging
+        mask = self.masks[state]
+        return frozenset(s for i, s in enumerate(self.order) if mask >> i & 1)
+
+    def step(self, state: int, symbol) -> int:
+        nxt = self.next[state].get(symbol)
+        if nxt is not None:
+            return nxt
+        # first time this transition is taken: union the moves of the subset;
+        # characters the alphabet does not name move like OTHER
+        move = symbol if symbol in self.S or OTHER not in self.S else OTHER
+        target = 0
+        rest = self.masks[state]
+        moves = self.moves
+        while rest:
+            low = rest & -rest
+            target |= moves[low.bit_length() - 1].get(move, 0)
+            rest ^= low
+        target &= self.live
+        if not target:
+            nxt = -1
+        else:
+            nxt = self.ids.get(target)
+            if nxt is None:
+                if len(self.masks) >= self.max_states:
+                    # out of room: start over, the old state ids are no longer valid
+                    self.flushes += 1
+                    self.flush()
+                    return self.ids[target] if target in self.ids else self.add(target)
+                nxt = self.add(target)
+        self.next[state][symbol] = nxt
+        return nxt
+
+    def accept(self, word: Iterable) -> bool:
+        state = self.start
+        if not self.masks[state]:
+            return False
+        for symbol in word:
+            state = self.step(state, symbol)
+            if state < 0:
+                return False
+        return self.accepting[state]
+
+    def match_prefix(self, word, start: int = 0) -> int:
+        # end of the longest accepted prefix of word[start:], or -1 if there is none
+        state = self.start
+        if not self.masks[state]:
+            return -1
+        last_accept = start if self.accepting[state] else -1
+        for i in range(start, len(word)):
+            state = self.step(state, word[i])
+            if state < 0:
+                break
+            if self.accepting[state]:
+                last_accept = i + 1
+        return last_accept
+
+    def accept_many(self, words: Iterable) -> list[bool]:
+        accept = self.accept
+        return [accept(word) for word in words]
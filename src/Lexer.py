@@ -1,101 +1,374 @@
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import TextIO
+
 from .Regex import Regex, parse_regex
-from .NFA import NFA, EPSILON
+from .NFA import NFA, EPSILON, StateAllocator, StateBudgetExceeded
+from .DFA import DFA
+from .LazyDFA import LazyDFA
+from .SymbolClasses import SymbolClasses
+from .TokenEngines import TokenDFA, TaggedDFA, LazyTaggedDFA, TokenNFA, UNKNOWN
+from .LineIndex import LineIndex
+from .TokenSpans import TokenSpans
+
+# cost model of the compile budget, in bytes: a DFA state is one row of int32 in the
+# dense table, a lazy DFA state also keeps its NFA subset as a bitmask
+BYTES_PER_ENTRY = 4
+# a lazy DFA with fewer states than this flushes too often to beat NFA simulation
+MIN_LAZY_STATES = 64
+
+
+@dataclass
+class RulePlan:
+    # how one token rule is run, see Lexer.plan
+    token: str
+    # 'dfa' (determinized and minimized up front), 'lazy' or 'nfa'
+    engine: str
+    # states of the rule's NFA
+    nfa_states: int
+    # worst-case DFA states, from the regex alone
+    estimate: int
+    # states of the rule's own minimized DFA, None when it was not built
+    dfa_states: int | None = None
+
 
 class Lexer:
-    def __init__(self, spec: list[tuple[str, str]]) -> None:
+    def __init__(self, spec: list[tuple[str, str]], combined: bool = True, linear: bool = False,
+                 workers: int = 1, lazy: bool = False, max_states: int = 10000,
+                 memory_budget: int | None = None, construction: str = 'thompson') -> None:
+        # construction is how the rule NFAs are built: 'thompson' or 'glushkov'
+        # (epsilon-free, one state per position)
+        if construction not in ('thompson', 'glushkov'):
+            raise ValueError(f'unknown NFA construction {construction!r}')
         self.spec = spec
-        AFNs = []
-        for token, regex_str in spec:
-            regex = parse_regex(regex_str)
-            afn = regex.thompson()
-            AFNs.append((token, afn))
+        # one allocator for the whole spec, so the token NFAs never share a state id
+        self.allocator = StateAllocator()
+
+        def compile_rule(regex_str):
+            # simplified first, so every later stage works on a smaller regex
+            regex = parse_regex(regex_str).simplify()
+            if construction == 'glushkov':
+                return regex, regex.glushkov(self.allocator)
+            return regex, regex.thompson(self.allocator)
+
+        # the rules are independent, so they can be compiled on a thread pool
+        regex_strs = [regex_str for _, regex_str in spec]
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                compiled = list(pool.map(compile_rule, regex_strs))
+        else:
+            compiled = [compile_rule(regex_str) for regex_str in regex_strs]
+        regexes = [regex for regex, _ in compiled]
+        AFNs = [(token, afn) for (token, _), (_, afn) in zip(spec, compiled)]
         self.AFNs = AFNs
-        
-        self.token_dfas = []
-        for token, afn in AFNs:
-            dfa = afn.subset_construction()
-            self.token_dfas.append((token, dfa))
-    
+
+        # characters that no rule tells apart share a class, and everything
+        # from here on runs over class ids instead of characters
+        self.symbols = SymbolClasses.from_nfas(afn for _, afn in AFNs)
+        class_afns = [self.symbols.collapse(afn).trim()[0] for _, afn in AFNs]
+
+        self.combined = combined
+        # remember failed (state, position) pairs so max-munch never rescans them
+        self.linear = linear
+        # bytes of one row of a dense DFA table (one extra column for unknown characters)
+        row = BYTES_PER_ENTRY * (len(self.symbols) + 1)
+
+        # decide how every rule is run; without a budget all rules are determinized
+        # up front (or all lazily), with one the rules are determinized in spec order
+        # while they fit and the others fall back to a lazy DFA or NFA simulation
+        self.plan = []
+        token_dfas = {}
+        remaining = memory_budget
+        for (token, _), regex, afn in zip(spec, regexes, class_afns):
+            nfa_states = len(afn.states())
+            if memory_budget is None:
+                estimate = regex.dfa_estimate(max_states)
+                self.plan.append(RulePlan(token, 'lazy' if lazy else 'dfa', nfa_states, estimate))
+                continue
+            limit = max(remaining, 0) // row
+            estimate = regex.dfa_estimate(limit + 1)
+            try:
+                # the estimate is a worst case without the sink: when it fits with the
+                # sink no check is needed, otherwise the construction stops as soon
+                # as it goes over
+                dfa = afn.subset_construction(max_states=None if estimate + 1 <= limit else limit)
+            except StateBudgetExceeded:
+                self.plan.append(RulePlan(token, 'overflow', nfa_states, estimate))
+                continue
+            dfa, _ = dfa.minimize().trim()
+            remaining -= len(dfa.K) * row
+            token_dfas[len(self.plan)] = dfa
+            self.plan.append(RulePlan(token, 'dfa', nfa_states, estimate, len(dfa.K)))
+
+        # the rules that did not fit share one lazy DFA when the rest of the budget
+        # holds a useful cache for it, otherwise they are simulated on their NFAs
+        reserve = 0
+        overflow = [idx for idx, rule in enumerate(self.plan) if rule.engine == 'overflow']
+        if overflow:
+            lazy_row = row + (sum(self.plan[idx].nfa_states for idx in overflow) + 7) // 8
+            cache = min(max_states, max(remaining, 0) // lazy_row)
+            engine = 'lazy' if cache >= MIN_LAZY_STATES else 'nfa'
+            if engine == 'lazy':
+                max_states = cache
+                reserve = cache * lazy_row
+            for idx in overflow:
+                self.plan[idx].engine = engine
+
+        def rules(engine):
+            return [(idx, class_afns[idx]) for idx, rule in enumerate(self.plan) if rule.engine == engine]
+
+        self.engines = []
+        eager = rules('dfa')
+        if eager and combined:
+            # a single DFA for the eager rules, each state tagged with the token it accepts;
+            # with a budget it may not outgrow what is left after the lazy cache, and
+            # the rules keep their own DFAs if it would
+            limit = None if memory_budget is None else (memory_budget - reserve) // row
+            try:
+                dfa, tags, alive = self.build_combined_dfa(eager, self.allocator(), limit)
+            except StateBudgetExceeded:
+                pass
+            else:
+                self.engines.append(TaggedDFA(dfa, tags, alive, self.symbols))
+                eager = []
+        for idx, afn in eager:
+            dfa = token_dfas.get(idx)
+            if dfa is None:
+                # drop useless states before and after determinization
+                dfa, _ = afn.subset_construction().minimize().trim()
+            self.engines.append(TokenDFA(idx, dfa))
+        lazy_rules = rules('lazy')
+        if lazy_rules:
+            # determinize on the fly, keeping at most max_states DFA states around;
+            # every state is labelled with its (tag, alive) pair
+            nfa, owner = self.build_combined_nfa(lazy_rules, self.allocator())
+            label = partial(self.label_subset, owner, nfa.F, nfa.q0)
+            self.engines.append(LazyTaggedDFA(LazyDFA(nfa, max_states, label)))
+        for idx, afn in rules('nfa'):
+            self.engines.append(TokenNFA(idx, afn))
+
+    @staticmethod
+    def build_combined_nfa(afns: list[tuple[int, NFA[int]]], q0: int) -> tuple[NFA[int], dict[int, int]]:
+        # afns are (spec index, NFA) pairs; the token NFAs come from one allocator,
+        # so their state ids are already disjoint and they can be put side by side
+        # as they are; q0 is a fresh id
+        S, K, d, F = set(), set(), {}, set()
+        owner = {}
+        for idx, afn in afns:
+            # take every state the NFA mentions, K alone may be incomplete
+            states = afn.states()
+            S |= afn.S
+            K |= states
+            d.update(afn.d)
+            F |= afn.F
+            for s in states:
+                owner[s] = idx
+        # fresh start state with epsilon moves into every token NFA
+        K.add(q0)
+        d[(q0, EPSILON)] = {afn.q0 for _, afn in afns}
+        # after trimming, every NFA state left can still reach a final state of its own token
+        nfa, _ = NFA(S, K, q0, d, F).trim()
+        return nfa, owner
+
+    @staticmethod
+    def label_subset(owner: dict[int, int], F: set[int], q0: int, subset: frozenset) -> tuple[int | None, int]:
+        # the earliest defined token wins when several accept at once
+        accepted = [owner[s] for s in subset if s in F]
+        tag = min(accepted) if accepted else None
+        # bitmask of the tokens that could still match from this state
+        mask = 0
+        for s in subset:
+            # the shared start state belongs to no token
+            if s != q0:
+                mask |= 1 << owner[s]
+        return tag, mask
+
+    @classmethod
+    def build_combined_dfa(cls, afns: list[tuple[int, NFA[int]]], q0: int,
+                           max_states: int | None = None) -> tuple[DFA[int], list[int | None], list[int]]:
+        nfa, owner = cls.build_combined_nfa(afns, q0)
+        subsets = {}
+        dfa = nfa.subset_construction(subsets, max_states)
+        labels = {state: cls.label_subset(owner, nfa.F, q0, subset) for state, subset in subsets.items()}
+        # states are only merged when they have the same tag and alive mask
+        groups = {}
+        dfa, _ = dfa.minimize(key=labels.__getitem__, groups=groups).trim()
+        # renumber the DFA states that survived trimming densely again
+        dense = {state: i for i, state in enumerate(sorted(dfa.K))}
+        dfa = dfa.remap_states(dense.__getitem__)
+
+        # DFA states are numbered 0..n-1, so both tables are plain lists
+        tags = [None] * len(dense)
+        alive = [0] * len(dense)
+        for state, group in groups.items():
+            if group in dense:
+                tags[dense[group]], alive[dense[group]] = labels[state]
+        return dfa, tags, alive
+
+    def longest_match(self, codes: bytes | list[int], pos: int,
+                      failed: list[set] | None = None) -> tuple[int, int | None, int, int | None]:
+        # returns the end of the longest token starting at pos, its index in the spec,
+        # how far the furthest scan went and min_reach at pos as the scans recorded it
+        # (UNKNOWN if one of them could not); codes is the input encoded as symbol
+        # class ids, and failed holds one memo per engine for linear-time lexing
+        best_idx = None
+        best_end = pos
+        furthest = pos
+        min_reach = None
+        for k, engine in enumerate(self.engines):
+            end, idx, stop, reach = engine.longest_match(codes, pos, failed[k] if failed is not None else None)
+            furthest = max(furthest, stop)
+            if reach == UNKNOWN or min_reach == UNKNOWN:
+                min_reach = UNKNOWN
+            elif reach is not None and (min_reach is None or reach < min_reach):
+                min_reach = reach
+            if end is None or end <= pos:
+                continue
+            # Tie-break: prefer earlier definition
+            if end > best_end or (end == best_end and idx < best_idx):
+                best_end = end
+                best_idx = idx
+        return best_end, best_idx, furthest, min_reach
+
+    def min_reach(self, codes: bytes | list[int], pos: int) -> int | None:
+        # Determine the earliest position where a started rule gets stuck.
+        min_reach = None
+        for engine in self.engines:
+            reach = engine.min_reach(codes, pos)
+            if reach is not None and (min_reach is None or reach < min_reach):
+                min_reach = reach
+        return min_reach
+
+    def error_position(self, codes: bytes | list[int], pos: int, min_reach: int | None) -> int:
+        # where to report that no token starts at pos, given min_reach at pos as
+        # longest_match recorded it; only a scan cut short by a memo walks again
+        if min_reach == UNKNOWN:
+            min_reach = self.min_reach(codes, pos)
+
+        # If no DFA could start, error is at current position
+        # Otherwise, choose an error position derived from the earliest DFA stuck point.
+        if min_reach is None:
+            return pos
+        # Prefer the earliest stuck index; in some edge cases report the previous
+        # character when the DFA consumed multiple chars but didn't accept.
+        if (min_reach - pos) > 1:
+            return min_reach - 1
+        return min_reach
+
     def lex(self, word: str) -> list[tuple[str, str]]:
-        result = []
+        return self.lex_spans(word).tokens()
+
+    def lex_spans(self, word: str) -> TokenSpans:
+        # lexes word into (rule, start, end) columns, the lexemes stay in word
+        spans = TokenSpans(word, [token for token, _ in self.spec])
         pos = 0
         n = len(word)
-        
-        def count_lines(up_to_pos):
-            # Calculate lines (0-indexed)
-            return word[:up_to_pos].count('\n')
+
+        # classify every character once up front
+        codes = self.symbols.encode(word)
+
+        failed = None
+        if self.linear:
+            failed = [set() for _ in self.engines]
 
         while pos < n:
-            best_idx = None
-            best_token = None
-            best_end = pos
-
-            # Find longest matching token
-            for idx, (tok_name, dfa) in enumerate(self.token_dfas):
-                cur = dfa.q0
-                i = pos
-                last_accept = None
-                
-                # Check for epsilon acceptance (length 0)
-                if cur in dfa.F:
-                    last_accept = i
-
-                while i < n and (cur, word[i]) in dfa.d:
-                    cur = dfa.d[(cur, word[i])]
-                    i += 1
-                    if cur in dfa.F:
-                        last_accept = i
-                
-                if last_accept is not None and last_accept > best_end:
-                    best_end = last_accept
-                    best_token = tok_name
-                    best_idx = idx
-                elif last_accept is not None and last_accept == best_end and best_token is not None:
-                    # Tie-break: prefer earlier definition
-                    if idx < best_idx:
-                        best_token = tok_name
-                        best_idx = idx
-            if best_token is None or best_end == pos:
-                # Determine the earliest position where a started DFA gets stuck.
-                min_reach = None
-
-                for tok_name, dfa in self.token_dfas:
-                    cur = dfa.q0
-                    i = pos
-
-                    # Try to make at least one transition
-                    if i < n and (cur, word[i]) in dfa.d:
-                        # Follow the DFA as far as possible
-                        while i < n and (cur, word[i]) in dfa.d:
-                            cur = dfa.d[(cur, word[i])]
-                            i += 1
-                        if min_reach is None or i < min_reach:
-                            min_reach = i
-
-                # If no DFA could start, error is at current position
-                # Otherwise, choose an error position derived from the earliest DFA stuck point.
-                if min_reach is None:
-                    error_pos = pos
-                else:
-                    # Prefer the earliest stuck index; in some edge cases report the previous
-                    # character when the DFA consumed multiple chars but didn't accept.
-                    if (min_reach - pos) > 1:
-                        error_pos = min_reach - 1
-                    else:
-                        error_pos = min_reach
+            best_end, best_idx, _, min_reach = self.longest_match(codes, pos, failed)
+
+            if best_idx is None or best_end == pos:
+                error_pos = self.error_position(codes, pos, min_reach)
 
-                line = count_lines(error_pos)
+                # lines and columns come from the newline index, built in one pass
+                line, col = spans.lines.position(error_pos)
 
                 if error_pos >= n:
-                    return [("", f"No viable alternative at character EOF, line {line}")]
+                    spans.error = f"No viable alternative at character EOF, line {line}"
                 else:
-                    # Compute column (character index within the line)
-                    last_nl = word.rfind('\n', 0, error_pos)
-                    col = error_pos - (last_nl + 1)
-                    return [("", f"No viable alternative at character {col}, line {line}")]
+                    spans.error = f"No viable alternative at character {col}, line {line}"
+                return spans
 
-            lexeme = word[pos:best_end]
-            result.append((best_token, lexeme))
+            spans.append(best_idx, pos, best_end)
             pos = best_end
 
-        return result
\ No newline at end of file
+        return spans
+
+    def lex_stream(self, readable: TextIO | Iterable[str], chunk_size: int = 1 << 16,
+                   positions: bool = False) -> Iterator[tuple]:
+        # Lexes text read in chunks from a file object (or taken from an iterable of
+        # strings) and yields the tokens as soon as they are complete, so only the
+        # token being matched and the chunk after it are ever kept in memory.
+        # A token is complete once every engine got stuck before the end of the text
+        # read so far; until then more text is read and the pending token is scanned
+        # again. Every read at least doubles the pending text, so the rescans add up
+        # to linear time. On a lexing error the error is yielded last, as the only
+        # item lex() would return, after the tokens that came before it.
+        # With positions, tokens are yielded as (name, lexeme, line, column) and the
+        # error as ("", message, line, column).
+        if hasattr(readable, 'read'):
+            chunks = iter(partial(readable.read, chunk_size), '')
+        else:
+            chunks = iter(readable)
+        # the text not yet returned as tokens, and its symbol class ids
+        buffer = ''
+        codes = self.symbols.encode('')
+        pos = 0
+        eof = False
+        # line and column where the buffer starts, and the newlines in the buffer
+        line = col = 0
+        lines = LineIndex(buffer)
+        failed = None
+
+        def position(offset):
+            # line and column of an offset in the buffer
+            buffer_line, buffer_col = lines.position(offset)
+            return line + buffer_line, buffer_col if buffer_line else col + buffer_col
+
+        while True:
+            if pos == len(buffer) and eof:
+                return
+            end, idx, stop, min_reach = self.longest_match(codes, pos, failed)
+            if stop >= len(buffer) and not eof:
+                # the token may go on in the next chunk: drop what was already
+                # returned and read at least as much as is pending
+                line, col = position(pos)
+                buffer, codes = buffer[pos:], codes[pos:]
+                pos = 0
+                read = []
+                wanted = max(len(buffer), 1)
+                while wanted > 0:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        eof = True
+                        break
+                    read.append(chunk)
+                    wanted -= len(chunk)
+                chunk = ''.join(read)
+                buffer += chunk
+                codes += self.symbols.encode(chunk)
+                lines = LineIndex(buffer)
+                # the memos are positions in the old buffer and may have been cut short by its end
+                if self.linear:
+                    failed = [set() for _ in self.engines]
+                continue
+
+            if idx is None or end == pos:
+                # same error position as lex()
+                error_pos = self.error_position(codes, pos, min_reach)
+                error_line, error_col = position(error_pos)
+                if error_pos >= len(buffer):
+                    message = f"No viable alternative at character EOF, line {error_line}"
+                else:
+                    message = f"No viable alternative at character {error_col}, line {error_line}"
+                # with positions the error has the same shape as the tokens
+                if positions:
+                    yield "", message, error_line, error_col
+                else:
+                    yield "", message
+                return
+
+            if positions:
+                yield (self.spec[idx][0], buffer[pos:end], *position(pos))
+            else:
+                yield self.spec[idx][0], buffer[pos:end]
+            pos = end
@@ -0,0 +1,35 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+
+NEWLINE = re.compile('\n')
+
+
+class LineIndex:
+    # The offsets of every newline in a text, found in one pass; the line and column
+    # of any offset are then looked up by binary search, without copying the text.
+    # Lines and columns count from 0.
+    def __init__(self, text: str) -> None:
+        self.newlines = array('I', [match.start() for match in NEWLINE.finditer(text)])
+
+    def line(self, offset: int) -> int:
+        # newlines before the offset
+        return bisect_left(self.newlines, offset)
+
+    def position(self, offset: int) -> tuple[int, int]:
+        line = self.line(offset)
+        if line == 0:
+            return 0, offset
+        return line, offset - self.newlines[line - 1] - 1
+
+    def positions(self, offsets: Iterable[int]) -> Iterator[tuple[int, int]]:
+        # the positions of increasing offsets, walking the index once instead of searching
+        newlines = self.newlines
+        line = 0
+        line_start = 0
+        for offset in offsets:
+            while line < len(newlines) and newlines[line] < offset:
+                line_start = newlines[line] + 1
+                line += 1
+            yield line, offset - line_start
@@ -1,7 +1,8 @@
-from .DFA import DFA
+from .DFA import DFA, OTHER
 
-from dataclasses import dataclass
-from collections.abc import Callable
+from dataclasses import dataclass, field
+from collections.abc import Callable, Iterable
+from threading import Lock
 
 EPSILON = ''  # this is how epsilon is represented by the checker in the transition function of NFAs
 
@@ -13,6 +14,22 @@ class NFA[STATE]:
     q0: STATE
     d: dict[tuple[STATE, str], set[STATE]]
     F: set[STATE]
+    # compiled form used by accept/match_prefix, built on first use; the NFA is
+    # not expected to change after it has been simulated
+    cached_simulator: 'NFASimulator' = field(default=None, init=False, compare=False, repr=False)
+
+    def simulator(self) -> 'NFASimulator':
+        if self.cached_simulator is None:
+            self.cached_simulator = NFASimulator(self)
+        return self.cached_simulator
+
+    def accept(self, word: Iterable) -> bool:
+        # simulate the NFA directly, without determinizing it
+        return self.simulator().accept(word)
+
+    def match_prefix(self, word, start: int = 0) -> int:
+        # end of the longest accepted prefix of word[start:], or -1 if there is none
+        return self.simulator().match_prefix(word, start)
 
     def epsilon_closure(self, state: STATE) -> set[STATE]:
         # create a stack of states where we will push the next state on the epsilon closure
@@ -36,29 +53,133 @@ class NFA[STATE]:
                     stack.append(next_state)
                 
         return closure
-        
-    def subset_construction(self) -> DFA[frozenset[STATE]]:
-        # initial closure will be the epsilon_closure on the starting state
-        initial_closure = self.epsilon_closure(self.q0)
+
+    def states(self) -> set[STATE]:
+        # K together with every state mentioned by q0, F or a transition
+        states = self.K | self.F | {self.q0}
+        for (s, _), nxt_set in self.d.items():
+            states.add(s)
+            states |= nxt_set
+        return states
+
+    def trim(self) -> tuple['NFA[STATE]', int]:
+        # keep only the states that are reachable from q0 and can reach a final state
+        # (q0 always stays), returns the pruned NFA and how many states were removed
+        forward = {}
+        backward = {}
+        for (s, _), nxt_set in self.d.items():
+            for nxt in nxt_set:
+                forward.setdefault(s, set()).add(nxt)
+                backward.setdefault(nxt, set()).add(s)
+
+        def walk(roots, edges):
+            seen = set(roots)
+            stack = list(roots)
+            while stack:
+                current = stack.pop()
+                for nxt in edges.get(current, ()):
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        stack.append(nxt)
+            return seen
+
+        states = self.states()
+        keep = (walk([self.q0], forward) & walk(self.F, backward)) | {self.q0}
+        new_d = {}
+        for (s, symbol), nxt_set in self.d.items():
+            if s in keep and nxt_set & keep:
+                new_d[(s, symbol)] = nxt_set & keep
+        trimmed = NFA(S=self.S, K=keep, q0=self.q0, d=new_d, F=self.F & keep)
+        return trimmed, len(states) - len(keep)
+
+    def epsilon_closures(self) -> dict[STATE, frozenset[STATE]]:
+        # computes the epsilon closure of every state at once; states on an epsilon
+        # cycle (Kleene, Plus) share one closure, so the epsilon graph is split into
+        # strongly connected components with an iterative Tarjan traversal
+        def epsilon_moves(state):
+            return self.d.get((state, EPSILON), ())
+
+        closures = {}
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        counter = 0
+        for root in self.states():
+            if root in index:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            # explicit DFS stack of (state, iterator over its epsilon successors)
+            work = [(root, iter(epsilon_moves(root)))]
+            while work:
+                state, successors = work[-1]
+                for nxt in successors:
+                    if nxt not in index:
+                        # descend into an unvisited successor
+                        index[nxt] = low[nxt] = counter
+                        counter += 1
+                        stack.append(nxt)
+                        on_stack.add(nxt)
+                        work.append((nxt, iter(epsilon_moves(nxt))))
+                        break
+                    if nxt in on_stack:
+                        low[state] = min(low[state], index[nxt])
+                else:
+                    # all successors done, propagate the low link to the parent
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[state])
+                    if low[state] != index[state]:
+                        continue
+                    # state is the root of a component: pop it off the stack
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == state:
+                            break
+                    # components reachable from this one are already finished, so the
+                    # closure is the component plus the closures it can step into
+                    closure = set(component)
+                    for member in component:
+                        for nxt in epsilon_moves(member):
+                            if nxt not in component:
+                                closure |= closures[nxt]
+                    closure = frozenset(closure)
+                    for member in component:
+                        closures[member] = closure
+        return closures
+
+    def subset_construction(self, subsets: dict[int, frozenset[STATE]] | None = None,
+                            max_states: int | None = None) -> DFA[int]:
+        # with max_states set, StateBudgetExceeded is raised as soon as the DFA would
+        # need more states than that (the sink included)
+        # all epsilon closures are computed once and only unioned afterwards
+        closures = self.epsilon_closures()
         # initial_state is a frozenset with initial closure (to be hashable we use frozenset)
-        initial_state = frozenset(initial_closure)
-        # dfa_states is initially simply the initial_state which as we know is a frozenset
-        dfa_states = {initial_state}
+        initial_state = closures[self.q0]
+        # every group gets an integer id in the order it is discovered (BFS), the
+        # frozensets are only needed while building and are dropped afterwards
+        ids = {initial_state: 0}
+        groups = [initial_state]
+        # the initial state counts against the budget like any other
+        if max_states is not None and max_states < 1:
+            raise StateBudgetExceeded(max_states)
         # no transitions initially have been processed
         dfa_transitions = {}
-        # same with final_states
-        dfa_final_states = set()
-        # didn't process the final_state yet
-        unprocessed_states = [initial_state]
-        # we need a sink_state in case there is a case where a transition on a character does not exist
-        sink_state = frozenset()
-        sink_needed = False
-        # while there are unprocessed_states
-        while unprocessed_states:
-            # pop the first state group
-            current = unprocessed_states.pop()
+        # iterate the alphabet in a fixed order so the numbering is canonical
+        alphabet = sorted(self.S)
+        # the groups list doubles as the BFS queue of unprocessed states
+        current_id = 0
+        while current_id < len(groups):
+            current = groups[current_id]
             # for all characters in alfabet
-            for symbol in self.S:
+            for symbol in alphabet:
                 # check the transitions for all states in the group and update next_states
                 next_states = set()
                 for nfa_state in current:
@@ -66,39 +187,104 @@ class NFA[STATE]:
                 epsilon_closure_next = set()
                 # after that apply the epsilon closure on each added state
                 for ns in next_states:
-                    epsilon_closure_next.update(self.epsilon_closure(ns))
-                # if there is at least one transition on this character
-                if epsilon_closure_next:
-                    # create a fronzenset from the epsilon_closure_next
-                    next_frozenset = frozenset(epsilon_closure_next)
-                    # update the dfa_transitions with this next_frozenset
-                    dfa_transitions[(current, symbol)] = next_frozenset
-                    # if next_frozenset was not in the dfa states, add it and add it to unprocessed states
-                    if next_frozenset not in dfa_states:
-                        dfa_states.add(next_frozenset)
-                        unprocessed_states.append(next_frozenset)
-                # If there is no transition from any element in current group on this symbol
-                else:
-                    # update transitions on this symbol for this group to sink_state 
-                    dfa_transitions[(current, symbol)] = sink_state
-                    # add sink_state to the states, and append it to unprocessed_states
-                    if not sink_needed:
-                        sink_needed = True
-                        dfa_states.add(sink_state)
-                        unprocessed_states.append(sink_state)
+                    epsilon_closure_next |= closures[ns]
+                # an empty group is the sink state, used when no state in the
+                # current group has a transition on this character
+                next_frozenset = frozenset(epsilon_closure_next)
+                # if next_frozenset was not seen yet, give it the next id and queue it
+                if next_frozenset not in ids:
+                    if max_states is not None and len(groups) >= max_states:
+                        raise StateBudgetExceeded(max_states)
+                    ids[next_frozenset] = len(groups)
+                    groups.append(next_frozenset)
+                # update the dfa_transitions with the id of next_frozenset
+                dfa_transitions[(current_id, symbol)] = ids[next_frozenset]
+            current_id += 1
         # the groups with final states will be the final groups
-        for dfa_state in dfa_states:
-            if any(s in self.F for s in dfa_state):
-                dfa_final_states.add(dfa_state)
+        dfa_final_states = {i for i, group in enumerate(groups) if not group.isdisjoint(self.F)}
+        # optionally keep the NFA subset behind every DFA state, for debugging
+        if subsets is not None:
+            subsets.update(enumerate(groups))
         # return the new DFA
         return DFA(
             S=self.S,
-            K=dfa_states,
-            q0=initial_state,
+            K=set(range(len(groups))),
+            q0=0,
             d=dfa_transitions,
             F=dfa_final_states
         )
 
+    def subset_construction_bitset(self, subsets: dict[int, frozenset[STATE]] | None = None,
+                                   max_states: int | None = None) -> DFA[int]:
+        # same construction as subset_construction, but NFA states are numbered
+        # densely and every set of states is an int bitmask, so unions and hashing
+        # are single big-int operations
+        order = list(self.states())
+        bit = {s: i for i, s in enumerate(order)}
+        closures = self.epsilon_closures()
+        # closure of every NFA state as a bitmask
+        closure_mask = [0] * len(order)
+        for s, i in bit.items():
+            mask = 0
+            for t in closures[s]:
+                mask |= 1 << bit[t]
+            closure_mask[i] = mask
+        # outgoing moves of every NFA state, with the targets already closed under epsilon
+        moves = [[] for _ in order]
+        for (s, symbol), nxt_set in self.d.items():
+            if symbol == EPSILON or symbol not in self.S:
+                continue
+            mask = 0
+            for t in nxt_set:
+                mask |= closure_mask[bit[t]]
+            moves[bit[s]].append((symbol, mask))
+        final_mask = 0
+        for s in self.F:
+            final_mask |= 1 << bit[s]
+
+        alphabet = sorted(self.S)
+        start = closure_mask[bit[self.q0]]
+        # mask -> DFA state id, and the masks in the order they were discovered
+        ids = {start: 0}
+        masks = [start]
+        if max_states is not None and max_states < 1:
+            raise StateBudgetExceeded(max_states)
+        d = {}
+        current_id = 0
+        # the masks list doubles as the BFS queue
+        while current_id < len(masks):
+            current = masks[current_id]
+            # union the moves of every NFA state in the current set, per symbol
+            step = {}
+            rest = current
+            while rest:
+                low = rest & -rest
+                for symbol, target in moves[low.bit_length() - 1]:
+                    step[symbol] = step.get(symbol, 0) | target
+                rest ^= low
+            for symbol in alphabet:
+                # the empty mask is the sink state
+                target = step.get(symbol, 0)
+                if target not in ids:
+                    if max_states is not None and len(masks) >= max_states:
+                        raise StateBudgetExceeded(max_states)
+                    ids[target] = len(masks)
+                    masks.append(target)
+                d[(current_id, symbol)] = ids[target]
+            current_id += 1
+
+        # optionally give back the NFA subset behind every DFA state, for debugging
+        if subsets is not None:
+            for i, mask in enumerate(masks):
+                subsets[i] = frozenset(order[j] for j in range(len(order)) if mask >> j & 1)
+        return DFA(
+            S=self.S,
+            K=set(range(len(masks))),
+            q0=0,
+            d=d,
+            F={i for i, mask in enumerate(masks) if mask & final_mask}
+        )
+
     def remap_states[OTHER_STATE](self, f: 'Callable[[STATE], OTHER_STATE]') -> 'NFA[OTHER_STATE]':
         new_K = {f(s) for s in self.K}
         new_q0 = f(self.q0)
@@ -108,3 +294,185 @@ class NFA[STATE]:
             new_nxt_set = {f(nxt_state) for nxt_state in nxt_set}
             new_d[(f(s), symbol)] = new_nxt_set
         return NFA(S=self.S, K=new_K, q0=new_q0, d=new_d, F=new_F)
+
+
+class StateBudgetExceeded(Exception):
+    # raised by the subset constructions when the DFA outgrows its state budget
+    def __init__(self, max_states: int) -> None:
+        super().__init__(f'determinization needs more than {max_states} states')
+        self.max_states = max_states
+
+
+class SparseSet:
+    # A set of ints in 0..capacity-1 with O(1) add, membership and clear, that keeps
+    # the insertion order: the members are dense[:size], and x is a member when
+    # dense[sparse[x]] == x (sparse may hold garbage for the other values)
+    def __init__(self, capacity: int) -> None:
+        self.dense = [0] * capacity
+        self.sparse = [0] * capacity
+        self.size = 0
+
+    def __contains__(self, x: int) -> bool:
+        i = self.sparse[x]
+        return i < self.size and self.dense[i] == x
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        return iter(self.dense[:self.size])
+
+    def add(self, x: int) -> None:
+        if x not in self:
+            self.sparse[x] = self.size
+            self.dense[self.size] = x
+            self.size += 1
+
+    def clear(self) -> None:
+        self.size = 0
+
+
+class NFASimulator:
+    # Runs an NFA directly, Pike VM style: the current position is an ordered list
+    # of NFA states without duplicates (a SparseSet), and every input symbol maps
+    # it to the next list. Epsilon closures are precomputed, and only the states
+    # that matter after a closure (with a symbol move, or final) are ever listed,
+    # so a step costs O(m) for m NFA states and a whole run O(n * m), with no
+    # determinization at all.
+    def __init__(self, nfa: NFA) -> None:
+        # states that can never reach a final state would only slow the lists down
+        nfa, _ = nfa.trim()
+        closures = nfa.epsilon_closures()
+        # number the states that matter densely
+        movers = {s for (s, symbol) in nfa.d if symbol != EPSILON}
+        important = [s for s in nfa.states() if s in nfa.F or s in movers]
+        number = {s: i for i, s in enumerate(important)}
+
+        def closed(states):
+            # ordered, deduplicated ids of the important states in the closure
+            ids = {}
+            for s in states:
+                for t in closures[s]:
+                    if t in number:
+                        ids.setdefault(number[t], None)
+            return tuple(ids)
+
+        self.start = closed([nfa.q0])
+        # moves[i][symbol] = closed targets of the i-th important state
+        self.moves = [{} for _ in important]
+        for (s, symbol), nxt_set in nfa.d.items():
+            if symbol != EPSILON:
+                self.moves[number[s]][symbol] = closed(nxt_set)
+        self.final = bytearray(1 if s in nfa.F else 0 for s in important)
+        self.states = len(important)
+        # the named symbols, when characters outside them have to be read as OTHER
+        self.alphabet = nfa.S if OTHER in nfa.S else None
+
+    def run(self, word, start: int = 0, memo: set | None = None,
+            trail: list | None = None) -> tuple[int, int, bool]:
+        # returns the end of the longest accepted prefix of word[start:] (-1 if there
+        # is none), the position where the simulation got stuck (len(word) if never)
+        # and whether memo stopped it first; memo holds (set of states, position)
+        # pairs known to lead to no further acceptance, and the pairs this run visits
+        # are appended to trail so the caller can add the failed ones to it
+        moves, final, alphabet = self.moves, self.final, self.alphabet
+        current, nxt = SparseSet(self.states), SparseSet(self.states)
+        for s in self.start:
+            current.add(s)
+        last_accept = start if any(final[s] for s in self.start) else -1
+        if not current.size:
+            return last_accept, start, False
+        for i in range(start, len(word)):
+            if memo is not None:
+                # the same states can be listed in any order, so the key is a set
+                key = (frozenset(current.dense[:current.size]), i)
+                if key in memo:
+                    return last_accept, i, True
+                if trail is not None:
+                    trail.append(key)
+            symbol = word[i]
+            if alphabet is not None and symbol not in alphabet:
+                symbol = OTHER
+            dense, sparse = nxt.dense, nxt.sparse
+            size = 0
+            accepting = False
+            for k in range(current.size):
+                for t in moves[current.dense[k]].get(symbol, ()):
+                    j = sparse[t]
+                    if j < size and dense[j] == t:
+                        continue
+                    sparse[t] = size
+                    dense[size] = t
+                    size += 1
+                    if final[t]:
+                        accepting = True
+            nxt.size = size
+            if not size:
+                # no thread left, nothing longer can match
+                return last_accept, i, False
+            current, nxt = nxt, current
+            if accepting:
+                last_accept = i + 1
+        return last_accept, len(word), False
+
+    def accept(self, word) -> bool:
+        return self.run(word)[0] == len(word)
+
+    def match_prefix(self, word, start: int = 0) -> int:
+        # end of the longest accepted prefix of word[start:], or -1 if there is none
+        return self.run(word, start)[0]
+
+    def reach(self, word, start: int = 0) -> int:
+        # how far the NFA can read word[start:] before every thread has died
+        return self.run(word, start)[1]
+
+    def accept_many(self, words: Iterable) -> list[bool]:
+        accept = self.accept
+        return [accept(word) for word in words]
+
+
+class StateAllocator:
+    # Hands out fresh state ids, safe to share between threads. NFAs built from the
+    # same allocator never share an id, so they can be put side by side as they are
+    def __init__(self, first: int = 0) -> None:
+        self.next_state = first
+        self.lock = Lock()
+
+    def __call__(self) -> int:
+        with self.lock:
+            state = self.next_state
+            self.next_state += 1
+        return state
+
+
+class NFABuilder:
+    # Grows a single transition table while a regex is walked: every construction
+    # step only appends states and edges, so building an NFA is linear in the size
+    # of the regex instead of copying the children's tables at every node
+    def __init__(self, new_state: Callable[[], int], alphabet: Iterable[str] = ()) -> None:
+        # where fresh state ids come from
+        self.new_state_id = new_state
+        # the characters the regex names, they are part of the alphabet even when
+        # no edge reads them (the ones a negated class excludes)
+        self.alphabet = frozenset(alphabet)
+        self.S = set(self.alphabet)
+        self.K = set()
+        self.d = {}
+
+    def new_state(self) -> int:
+        state = self.new_state_id()
+        self.K.add(state)
+        return state
+
+    def add(self, state: int, symbol: str, nxt: int) -> None:
+        # add the edge state -symbol-> nxt
+        if symbol != EPSILON:
+            self.S.add(symbol)
+        targets = self.d.get((state, symbol))
+        if targets is None:
+            self.d[(state, symbol)] = {nxt}
+        else:
+            targets.add(nxt)
+
+    def nfa(self, q0: int, *final: int) -> NFA[int]:
+        return NFA(self.S, self.K, q0, self.d, set(final))
@@ -7,14 +7,14 @@ class Parser:
         self.grammar = grammar
 
     def parse(self, input: str):
-        tokens = self.lexer.lex(input)
+        spans = self.lexer.lex_spans(input)
 
         # 1. Check for Lexer errors
-        if tokens and tokens[0][0] == "":
-            return tokens[0][1] # Return the error string
+        if spans.error is not None:
+            return spans.error # Return the error string
 
-        # 2. Filter out SPACE tokens
-        non_space_tokens = [tok for tok in tokens if tok[0] != "SPACE"]
+        # 2. Filter out SPACE tokens, their lexemes are never sliced
+        non_space_tokens = spans.tokens(exclude={"SPACE"})
 
         # 3. Parse the filtered tokens
         parse_tree = self.grammar.cykParse(non_space_tokens)
@@ -1,15 +1,160 @@
-
+from collections.abc import Callable
 from typing import Any, List
 
-from .NFA import NFA
+from .NFA import NFA, NFABuilder, NFASimulator, StateAllocator, StateBudgetExceeded
+from .DFA import DFA, OTHER
+from .DFAMatcher import DFAMatcher
 
 EPSILON = ''
 
-stare = 0
-
 class Regex:
-    
-    def thompson(self) -> NFA[int]:
+
+    def thompson(self, allocator: StateAllocator | None = None) -> NFA[int]:
+        # every node adds its states and edges to one shared builder; state ids come
+        # from the given allocator, or from a fresh one starting at 0
+        builder = NFABuilder(allocator or StateAllocator(), self.alphabet())
+        start, final = self.fold(lambda node, fragments: node.build(builder, fragments))
+        return builder.nfa(start, final)
+
+    def children(self) -> tuple['Regex', ...]:
+        # the sub-regexes of this node, left to right
+        return ()
+
+    def alphabet(self) -> frozenset[str]:
+        # every character the regex names: its literals, and the members of its
+        # classes, negated ones included; any other character is read as OTHER
+        chars = set()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children())
+            if isinstance(node, CharClass):
+                chars |= node.chars
+            elif isinstance(node, Character) and node.c != EPSILON:
+                chars.add(node.c)
+        return frozenset(chars)
+
+    def fold(self, visit: Callable[['Regex', list], Any]) -> Any:
+        # calls visit(node, results of its children) on every node, children first
+        # and left to right, and returns the result for the root; the tree is walked
+        # with an explicit stack, so its depth is not limited by the recursion limit
+        return postorder(self, lambda node: node.children(), visit)
+
+    def dfa_estimate(self, cap: int) -> int:
+        # worst-case number of DFA states for this regex (missing transitions are not
+        # counted as a state), from the state complexity of every operator; results
+        # are capped at cap so nested stars do not build huge ints
+        return self.fold(lambda node, bounds: node.estimate(cap, bounds))
+
+    def simplify(self) -> 'Regex':
+        # an equivalent, usually smaller regex (see RegexSimplifier)
+        from .RegexSimplifier import RegexSimplifier
+        return RegexSimplifier().simplify(self)
+
+    def glushkov(self, allocator: StateAllocator | None = None) -> NFA[int]:
+        # the position automaton: one initial state plus one state per position, and
+        # an edge into a position on each of its characters; it has no epsilon moves
+        positions = Positions(self)
+        builder = NFABuilder(allocator or StateAllocator(), positions.alphabet)
+        q0 = builder.new_state()
+        states = [builder.new_state() for _ in positions.symbols]
+
+        def connect(source, targets):
+            for q in targets:
+                if q != END:
+                    for c in positions.symbols[q]:
+                        builder.add(source, c, states[q])
+
+        connect(q0, positions.first)
+        for p, follow in enumerate(positions.follow):
+            connect(states[p], follow)
+        final = [states[p] for p in positions.last]
+        if positions.nullable:
+            final.append(q0)
+        return builder.nfa(q0, *final)
+
+    def followpos_dfa(self, max_states: int | None = None) -> DFA[int]:
+        # builds the DFA straight from the regex (Aho, Sethi, Ullman): a DFA state is a
+        # set of positions that can be read next, plus END when the input read so far
+        # is a complete match; no NFA and no epsilon closures are involved.
+        # The result is complete (the empty set is the sink) and numbered in BFS order
+        # like subset_construction's, and max_states bounds it the same way
+        positions = Positions(self)
+        symbols, follow = positions.symbols, positions.follow
+        start = positions.first | ({END} if positions.nullable else set())
+        start = frozenset(start)
+        ids = {start: 0}
+        groups = [start]
+        d = {}
+        alphabet = sorted(set().union(positions.alphabet, *symbols))
+        current_id = 0
+        # the groups list doubles as the BFS queue
+        while current_id < len(groups):
+            # union the followpos of every position in the group, per character
+            step = {}
+            for p in groups[current_id]:
+                if p == END:
+                    continue
+                for c in symbols[p]:
+                    step.setdefault(c, set()).update(follow[p])
+            for c in alphabet:
+                target = frozenset(step.get(c, ()))
+                if target not in ids:
+                    if max_states is not None and len(groups) >= max_states:
+                        raise StateBudgetExceeded(max_states)
+                    ids[target] = len(groups)
+                    groups.append(target)
+                d[(current_id, c)] = ids[target]
+            current_id += 1
+        return DFA(
+            S=set(alphabet),
+            K=set(range(len(groups))),
+            q0=0,
+            d=d,
+            F={i for i, group in enumerate(groups) if END in group}
+        )
+
+    def compile(self, max_states: int | None = None, method: str = 'thompson') -> 'DFAMatcher | NFASimulator | DerivativeMatcher':
+        # a matcher with accept/match_prefix for this regex: a minimized DFA when
+        # determinization stays within max_states DFA states, otherwise the NFA is
+        # simulated directly, which is slower per character but never blows up.
+        # method picks how the automata are built: 'thompson' (Thompson NFA),
+        # 'glushkov' (epsilon-free position NFA), 'followpos' (the DFA directly
+        # from the regex, with the position NFA as fallback) or 'derivatives'
+        # (nothing up front, the DFA is built from derivatives while matching;
+        # max_states does not apply)
+        if method not in ('thompson', 'glushkov', 'followpos', 'derivatives'):
+            raise ValueError(f'unknown compile method {method!r}')
+        regex = self.simplify()
+        if method == 'derivatives':
+            from .Derivatives import DerivativeMatcher
+            return DerivativeMatcher.from_regex(regex)
+        if method == 'followpos':
+            try:
+                dfa = regex.followpos_dfa(max_states)
+            except StateBudgetExceeded:
+                # the position NFA is only built when the DFA does not fit
+                return NFASimulator(regex.glushkov())
+            return DFAMatcher(dfa.minimize())
+        nfa = regex.thompson() if method == 'thompson' else regex.glushkov()
+        try:
+            dfa = nfa.subset_construction(max_states=max_states)
+        except StateBudgetExceeded:
+            return NFASimulator(nfa)
+        return DFAMatcher(dfa.minimize())
+
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # add this node's fragment to the builder, given the (start, final) states of
+        # the children's fragments, and return its own (start, final) states
+        pass
+
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        # dfa_estimate of this node, given the estimates of its children
+        pass
+
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        # number the positions of this node in positions, extend their followpos and
+        # return (nullable, firstpos, lastpos) of the node, given those of its children
         pass
 # kleene star operator class (zero or more repetitions)
 class Kleene(Regex):
@@ -17,116 +162,93 @@ class Kleene(Regex):
     def __init__(self, reg:Regex):
         # store the inner regex expression
         self.reg = reg
-    # construct nfa for kleene star using thompson's construction
-    def thompson(self) -> NFA[int]:
-        # access global state counter
-        global stare
+    # the inner expression is the only child
+    def children(self) -> tuple[Regex, ...]:
+        return (self.reg,)
+    # build the kleene star fragment using thompson's construction
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # the fragment of the inner expression is already built
+        (start, final), = fragments
         # create new initial state
-        q0 = stare
-        # increment state counter
-        stare+=1
-        # recursively build nfa for inner expression
-        n = self.reg.thompson()
-        # copy transition function from inner nfa
-        d = n.d.copy()
+        q0 = builder.new_state()
         # create new final state
-        f = stare
-        # increment state counter
-        stare+=1
-        # add epsilon transition from new start to inner start
-        d[(q0, EPSILON)] = {n.q0}
-        # add epsilon transition from new start to new final (allows zero repetitions)
-        d[(q0, EPSILON)].update({f})
-        # for each final state of inner nfa
-        for final in n.F:
-            # if no epsilon transitions exist from this final state
-            if (final,EPSILON) not in d:   
-                # add epsilon transitions back to inner start and to new final
-                d[(final,EPSILON)]={n.q0,f}
-            # if epsilon transitions already exist
-            else:
-                # add to existing epsilon transitions back to start and to final
-                d[(final,EPSILON)].update({n.q0,f})
-        # combine all states: inner states plus new start and final
-        K=n.K | {q0,f}
-        # return nfa with same alphabet, combined states, new start, modified transitions, new final
-        return NFA(n.S,K,q0,d,{f})
+        f = builder.new_state()
+        # epsilon from new start to inner start, and to new final (allows zero repetitions)
+        builder.add(q0, EPSILON, start)
+        builder.add(q0, EPSILON, f)
+        # epsilon from inner final back to inner start and to new final
+        builder.add(final, EPSILON, start)
+        builder.add(final, EPSILON, f)
+        return q0, f
+    # the star of an m-state DFA needs up to 2^m states
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        return power_of_two(bounds[0], cap)
+    # the last positions loop back to the first ones, and the empty word matches
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        _, first, last = results[0]
+        positions.connect(last, first)
+        return True, first, last
 # optional operator class (zero or one occurrence)
 class Optional(Regex):
     # initialize with the inner regex to make optional
     def __init__(self, reg:Regex):
         # store the inner regex expression
         self.reg = reg
-    # construct nfa for optional using thompson's construction
-    def thompson(self) -> NFA[int]:
-        # access global state counter
-        global stare
+    # the inner expression is the only child
+    def children(self) -> tuple[Regex, ...]:
+        return (self.reg,)
+    # build the optional fragment using thompson's construction
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # the fragment of the inner expression is already built
+        (start, final), = fragments
         # create new initial state
-        q0 = stare
-        # increment state counter
-        stare+=1
-        # recursively build nfa for inner expression
-        n = self.reg.thompson()
-        # copy transition function from inner nfa
-        d = n.d.copy()
+        q0 = builder.new_state()
         # create new final state
-        f = stare
-        # increment state counter
-        stare+=1
-        # add epsilon transitions from new start to both inner start and new final (allows skipping)
-        d[(q0, EPSILON)] = {n.q0, f} 
-        # for each final state of inner nfa
-        for final in n.F:
-            # if no epsilon transitions exist from this final state
-            if (final,EPSILON) not in d:   
-                # add epsilon transition to new final
-                d[(final,EPSILON)]={f}
-            # if epsilon transitions already exist
-            else:
-                # add to existing epsilon transitions to new final
-                d[(final,EPSILON)].update({f})
-        # combine all states: inner states plus new start and final
-        K=n.K | {q0,f}
-        # return nfa with same alphabet, combined states, new start, modified transitions, new final
-        return NFA(n.S,K,q0,d,{f})
+        f = builder.new_state()
+        # epsilon from new start to both inner start and new final (allows skipping)
+        builder.add(q0, EPSILON, start)
+        builder.add(q0, EPSILON, f)
+        # epsilon from inner final to new final
+        builder.add(final, EPSILON, f)
+        return q0, f
+    # at most one new initial state
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        return min(bounds[0] + 1, cap)
+    # same positions as the inner regex, which may now be skipped
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        _, first, last = results[0]
+        return True, first, last
 # plus operator class (one or more repetitions)
 class Plus(Regex):
     # initialize with the inner regex to apply plus to
     def __init__(self, reg:Regex):
         # store the inner regex expression
         self.reg = reg
-    # construct nfa for plus using thompson's construction
-    def thompson(self) -> NFA[int]:
-        # access global state counter
-        global stare
+    # the inner expression is the only child
+    def children(self) -> tuple[Regex, ...]:
+        return (self.reg,)
+    # build the plus fragment using thompson's construction
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # the fragment of the inner expression is already built
+        (start, final), = fragments
         # create new initial state
-        q0 = stare
-        # increment state counter
-        stare+=1
-        # recursively build nfa for inner expression
-        n = self.reg.thompson()
-        # copy transition function from inner nfa
-        d = n.d.copy()
+        q0 = builder.new_state()
         # create new final state
-        f = stare
-        # increment state counter
-        stare+=1
-        # add epsilon transition from new start to inner start (must match at least once)
-        d[(q0, EPSILON)] = {n.q0}
-        # for each final state of inner nfa
-        for final in n.F:
-            # if no epsilon transitions exist from this final state
-            if (final,EPSILON) not in d:   
-                # add epsilon transitions back to inner start and to new final (allows repetition)
-                d[(final,EPSILON)]={n.q0,f}
-            # if epsilon transitions already exist
-            else:
-                # add to existing epsilon transitions back to start and to final
-                d[(final,EPSILON)].update({n.q0,f})
-        # combine all states: inner states plus new start and final
-        K=n.K | {q0,f}
-        # return nfa with same alphabet, combined states, new start, modified transitions, new final
-        return NFA(n.S,K,q0,d,{f})
+        f = builder.new_state()
+        # epsilon from new start to inner start (must match at least once)
+        builder.add(q0, EPSILON, start)
+        # epsilon from inner final back to inner start (repetition) and to new final
+        builder.add(final, EPSILON, start)
+        builder.add(final, EPSILON, f)
+        return q0, f
+    # same bound as the star
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        return power_of_two(bounds[0], cap)
+    # like the star, but the inner regex has to match at least once
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        nullable, first, last = results[0]
+        positions.connect(last, first)
+        return nullable, first, last
 # concatenation operator class (matches left then right)
 class Concat(Regex):
     # initialize with left and right regex expressions to concatenate
@@ -135,37 +257,28 @@ class Concat(Regex):
         self.left = left
         # store right regex expression
         self.right = right
-    # construct nfa for concatenation using thompson's construction
-    def thompson(self) -> NFA[int]:
-        # recursively build nfa for left expression
-        nl = self.left.thompson()
-        # recursively build nfa for right expression
-        nr = self.right.thompson()
-        # copy transition function from left nfa
-        delta = nl.d.copy()
-        # add all transitions from right nfa to combined transition function
-        for k,v in nr.d.items():
-            delta[k]=v
-        # connect left and right nfas by adding epsilon transitions from left finals to right start
-        for f in nl.F:
-            # if epsilon transitions already exist from this left final state
-            if (f, EPSILON) in delta:
-                # add right start to existing epsilon transitions
-                delta[(f, EPSILON)].add(nr.q0)
-            # if no epsilon transitions exist
-            else:
-                # create new epsilon transition to right start
-                delta[(f, EPSILON)] = {nr.q0}
-        # combine all states from both nfas
-        K = nl.K | nr.K
-        # combine alphabets from both nfas
-        S = nl.S | nr.S
-        # start state is the left nfa's start
-        start = nl.q0
-        # final states are the right nfa's finals
-        end = nr.F
-        # return nfa with combined alphabet, states, left start, merged transitions, right finals
-        return NFA(S,K,start,delta,end)
+    # left child first, then the right one
+    def children(self) -> tuple[Regex, ...]:
+        return (self.left, self.right)
+    # build the concatenation fragment using thompson's construction
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # the fragments of the left and right expressions are already built
+        (left_start, left_final), (right_start, right_final) = fragments
+        # connect them with an epsilon from the left final to the right start
+        builder.add(left_final, EPSILON, right_start)
+        # start at the left start, finish at the right final
+        return left_start, right_final
+    # every left state may be paired with any subset of the right states
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        left, right = bounds
+        return min(left * power_of_two(right - 1, cap), cap)
+    # the last positions of the left side are followed by the first of the right side
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        (left_nullable, left_first, left_last), (right_nullable, right_first, right_last) = results
+        positions.connect(left_last, right_first)
+        first = left_first | right_first if left_nullable else left_first
+        last = left_last | right_last if right_nullable else right_last
+        return left_nullable and right_nullable, first, last
 
 # union operator class (matches left or right)
 class Union(Regex):
@@ -175,68 +288,32 @@ class Union(Regex):
         self.left = left
         # store right regex expression
         self.right = right
-    # construct nfa for union using thompson's construction
-    def thompson(self) -> NFA[int]:
-        # access global state counter
-        global stare
+    # left child first, then the right one
+    def children(self) -> tuple[Regex, ...]:
+        return (self.left, self.right)
+    # build the union fragment using thompson's construction
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # the fragments of the left and right expressions are already built
+        (left_start, left_final), (right_start, right_final) = fragments
         # create new initial state
-        q0=stare
-        # increment state counter
-        stare+=1
-        # recursively build nfa for left expression
-        nl = self.left.thompson()
-        # recursively build nfa for right expression
-        nr = self.right.thompson()
-        # copy transition function from left nfa
-        d = nl.d.copy()
-        # if epsilon transitions already exist from new start
-        if (q0,EPSILON) in d:
-            # add epsilon transitions to both left and right starts
-            d[(q0, EPSILON)].update({nl.q0, nr.q0})
-        # if no epsilon transitions exist from new start
-        else:
-            # create epsilon transitions to both left and right starts
-            d[(q0,EPSILON)]={nl.q0,nr.q0}
+        q0 = builder.new_state()
         # create new single final state
-        F = {stare}
-        # increment state counter
-        stare+=1
-        # connect all left final states to new final with epsilon transitions
-        for f in nl.F:
-            # if epsilon transitions already exist from this left final
-            if (f, EPSILON) in d:
-                # add new final to existing epsilon transitions
-                d[(f, EPSILON)].update(F)
-            # if no epsilon transitions exist
-            else:
-                # create epsilon transition to new final
-                d[(f, EPSILON)] = F
-        # connect all right final states to new final with epsilon transitions
-        for f in nr.F:
-            # if epsilon transitions already exist from this right final
-            if (f, EPSILON) in d:
-                # add new final to existing epsilon transitions
-                d[(f, EPSILON)].update(F)
-            # if no epsilon transitions exist
-            else:
-                # create epsilon transition to new final
-                d[(f, EPSILON)] = F
-        # merge all transitions from right nfa into combined transition function
-        for k, v in nr.d.items():
-            # if transition already exists in combined function
-            if k in d:
-                # add right nfa's target states to existing transition
-                d[k].update(v)
-            # if transition doesn't exist
-            else:
-                # copy transition from right nfa
-                d[k] = v.copy()
-        # combine alphabets from both nfas
-        S = nl.S | nr.S
-        # combine all states from both nfas plus new start and final
-        K = nl.K | nr.K
-        # return nfa with combined alphabet and states, new start, merged transitions, new final
-        return NFA(S,K,q0,d,F)
+        f = builder.new_state()
+        # epsilon from new start to both left and right starts
+        builder.add(q0, EPSILON, left_start)
+        builder.add(q0, EPSILON, right_start)
+        # epsilon from both left and right finals to new final
+        builder.add(left_final, EPSILON, f)
+        builder.add(right_final, EPSILON, f)
+        return q0, f
+    # product construction, where either side may already be stuck
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        left, right = bounds
+        return min((left + 1) * (right + 1) - 1, cap)
+    # either side can start or end the match
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        (left_nullable, left_first, left_last), (right_nullable, right_first, right_last) = results
+        return left_nullable or right_nullable, left_first | right_first, left_last | right_last
 
 
 # character class represents a single literal character in regex
@@ -245,174 +322,239 @@ class Character(Regex):
     def __init__(self,c:str):
         # store the character
         self.c = c
-    # construct nfa for single character using thompson's construction
-    def thompson(self) -> NFA[int]:
-        # access global state counter
-        global stare
-        # if character is not epsilon (actual character)
-        if self.c != EPSILON:
-            # alphabet contains just this character
-            S = {self.c}
-            # create start state
-            start = stare
-            # increment state counter
-            stare+=1
-            # create end state
-            end = stare
-            # increment state counter
-            stare+=1
-            # states are start and end
-            K = {start,end}
-            # initial state is start
-            q0 = start
-            # final state is end
-            F = {end}
-            # single transition from start to end on character c
-            d = {(start, self.c):{end}}
-            # return nfa for single character
-            return NFA(S,K,q0,d,F)
-        # if character is epsilon (empty string)
+    # build the fragment for a single character using thompson's construction
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # create start state
+        start = builder.new_state()
+        # if character is epsilon (empty string) the same state is also final
+        if self.c == EPSILON:
+            return start, start
+        # create end state
+        end = builder.new_state()
+        # single transition from start to end on character c
+        builder.add(start, self.c, end)
+        return start, end
+    # epsilon needs one state, a character two
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        return min(1 if self.c == EPSILON else 2, cap)
+    # a character is one position, epsilon has none
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        if self.c == EPSILON:
+            return True, frozenset(), frozenset()
+        p = frozenset([positions.new_position({self.c})])
+        return False, p, p
+
+# character class node matching any one character from a set of ranges ([a-zA-Z0-9_], [^...])
+class CharClass(Regex):
+    # initialize with a list of (first, last) ranges and whether the class is negated
+    def __init__(self, ranges: list[tuple[str, str]], negated: bool = False):
+        # store the ranges as written
+        self.ranges = ranges
+        # store whether the class is negated
+        self.negated = negated
+        # expand the ranges into the set of characters written in the brackets;
+        # a negated class matches every character except these
+        chars = set()
+        for first, last in ranges:
+            chars.update(chr(c) for c in range(ord(first), ord(last) + 1))
+        self.chars = frozenset(chars)
+    # the symbols the class reads in an automaton over the given alphabet: its members,
+    # or for a negated class every other character of the alphabet and OTHER
+    def symbols(self, alphabet: frozenset[str]) -> frozenset[str]:
+        if self.negated:
+            return (alphabet - self.chars) | {OTHER}
+        return self.chars
+    # build a two-state fragment, the class is one start->end edge per symbol it reads
+    def build(self, builder: NFABuilder, fragments: list[tuple[int, int]]) -> tuple[int, int]:
+        # create start and end states
+        start = builder.new_state()
+        end = builder.new_state()
+        # no intermediate states or epsilon moves
+        for c in self.symbols(builder.alphabet):
+            builder.add(start, c, end)
+        return start, end
+    # a class is a single position, like a character
+    def estimate(self, cap: int, bounds: list[int]) -> int:
+        return min(2, cap)
+    # one position labelled with every symbol the class reads
+    def analyze(self, positions: 'Positions', results: list) -> tuple[bool, frozenset[int], frozenset[int]]:
+        p = frozenset([positions.new_position(self.symbols(positions.alphabet))])
+        return False, p, p
+
+# marks the end of the regex in the followpos sets, a set holding it is accepting
+END = -1
+
+# the positions (character and class leaves) of a regex, numbered left to right,
+# with the characters each one reads and the positions that can follow it
+class Positions:
+    def __init__(self, regex: Regex):
+        # the characters the regex names, what negated classes are taken against
+        self.alphabet = regex.alphabet()
+        # characters of every position
+        self.symbols = []
+        # followpos of every position, END included when the regex can stop there
+        self.follow = []
+        self.nullable, self.first, self.last = regex.fold(lambda node, results: node.analyze(self, results))
+        self.connect(self.last, frozenset([END]))
+
+    def new_position(self, chars) -> int:
+        self.symbols.append(frozenset(chars))
+        self.follow.append(set())
+        return len(self.symbols) - 1
+
+    def connect(self, last: frozenset[int], first: frozenset[int]) -> None:
+        # every position in last can be followed by every position in first
+        for p in last:
+            self.follow[p] |= first
+
+# generic post-order walk with an explicit stack: visit(node, results of its children)
+# is called on every node once all its children are done
+def postorder(root, children: Callable, visit: Callable) -> Any:
+    results = []
+    # (node, whether its children have been pushed already)
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        kids = children(node)
+        if expanded:
+            # the results of the children are the last len(kids) entries
+            count = len(kids)
+            args = results[len(results) - count:] if count else []
+            del results[len(results) - count:]
+            results.append(visit(node, args))
         else:
-            # empty alphabet for epsilon
-            S = set()
-            # create single state
-            start = stare
-            # increment state counter
-            stare+=1
-            # only one state exists
-            K = {start}
-            # initial state
-            q0 = start
-            # same state is also final (accepts empty string)
-            F = {start}
-            # no transitions needed for epsilon
-            d = {}
-            # return nfa that accepts empty string
-            return NFA(S,K,q0,d,F)
+            stack.append((node, True))
+            for kid in reversed(kids):
+                stack.append((kid, False))
+    return results[0]
+
+# the children of a node for postorder() when a whole chain of unions or of
+# concatenations is one node, whose children are the elements of the chain
+def chain_parts(regex: Regex) -> tuple[Regex, ...]:
+    if isinstance(regex, (Union, Concat)):
+        kind = type(regex)
+        items = []
+        stack = [regex]
+        while stack:
+            current = stack.pop()
+            if type(current) is kind:
+                stack.append(current.right)
+                stack.append(current.left)
+            else:
+                items.append(current)
+        return tuple(items)
+    return regex.children()
+
+# 2^n, without building the number when it would be over cap anyway; n <= 0
+# counts as 2^0, a bound is never below one state
+def power_of_two(n: int, cap: int) -> int:
+    return cap if n >= cap.bit_length() else min(1 << max(n, 0), cap)
 
 # main function to parse regex string into regex object tree
 def parse_regex(s:str):
-    # access global state counter
-    global stare
-    # reset state counter to 0 for new regex
-    stare = 0
     # preprocess string to handle escape sequences and create token list
     processed = preprocess(s)
-    # parse tokens starting with lowest precedence (union) from position 0
-    expr, pos_final = parse_union(processed, 0)
-    # return parsed regex tree
-    return expr
-
-# parse union operator (lowest precedence, right associative)
-def parse_union(s:list, pos:int):
-    # parse left operand using higher precedence function (concat)
-    left, pos = parse_concat(s, pos)
-    # check if current position has union operator and it's not escaped
-    if pos < len(s) and s[pos][0] == '|' and not s[pos][1]:
-        # skip past the union operator
-        pos += 1
-        # recursively parse right side to handle chained unions (a|b|c)
-        right, pos = parse_union(s, pos)
-        # create union node with left and right subtrees
-        return Union(left, right), pos
-    # no union operator found, return what concat parsed
-    return left, pos
-# parse concatenation (medium precedence, left associative, implicit operator)
-def parse_concat(s:list, pos:int):
-    # list to collect all consecutive terms to concatenate
-    terms = []
-    # keep parsing terms until we hit a delimiter (union, close paren, or end)
-    while pos < len(s) and not (s[pos][0] in '|)' and not s[pos][1]):
-        # parse each term using higher precedence function (postfix)
-        term, pos = parse_postfix(s, pos)
-        # add parsed term to list
-        terms.append(term)
-    # if no terms were parsed, return epsilon (empty string)
+    # parse the tokens with an explicit stack of open groups, so nesting and long
+    # unions are not limited by the recursion limit
+    return parse_tokens(processed)
+
+# parse the token list iteratively: union (lowest precedence, right associative),
+# concatenation (left associative, implicit operator), postfix operators (highest)
+def parse_tokens(s:list):
+    # every open group keeps the finished alternatives and the terms of the current one;
+    # the bottom entry is the whole regex
+    groups = [([], [])]
+    pos = 0
+    while pos < len(s):
+        char, is_literal = s[pos]
+        alternatives, terms = groups[-1]
+        # an unescaped bar closes the current alternative
+        if char == '|' and not is_literal:
+            alternatives.append(concat_terms(terms))
+            groups[-1] = (alternatives, [])
+            pos += 1
+        # opening parenthesis starts a new group
+        elif char == '(' and not is_literal:
+            groups.append(([], []))
+            pos += 1
+        # closing parenthesis finishes the group, which becomes a term of the outer one
+        elif char == ')' and not is_literal:
+            # an unmatched one ends the regex, the rest of the input is ignored
+            if len(groups) == 1:
+                break
+            groups.pop()
+            alternatives.append(concat_terms(terms))
+            groups[-1][1].append(union_alternatives(alternatives))
+            pos += 1
+        # postfix operators apply to the last term; with no term before them they are
+        # plain characters
+        elif char in '*+?' and not is_literal and terms:
+            if char == '*':
+                terms[-1] = Kleene(terms[-1])
+            elif char == '+':
+                terms[-1] = Plus(terms[-1])
+            else:
+                terms[-1] = Optional(terms[-1])
+            pos += 1
+        # opening bracket starts a character class like [a-z], [a-zA-Z0-9_] or [^0-9]
+        elif char == '[' and not is_literal:
+            char_class, pos = parse_char_class(s, pos + 1)
+            terms.append(char_class)
+        # regular character (or escaped special character)
+        else:
+            terms.append(Character(char))
+            pos += 1
+    # groups left open at the end of the input are closed there
+    while True:
+        alternatives, terms = groups.pop()
+        alternatives.append(concat_terms(terms))
+        result = union_alternatives(alternatives)
+        if not groups:
+            return result
+        groups[-1][1].append(result)
+
+# left-associate the terms of a concatenation: ((a.b).c).d, or epsilon if there are none
+def concat_terms(terms:list):
     if not terms:
-        return Character(EPSILON), pos
-    # start with first term
+        return Character(EPSILON)
     result = terms[0]
-    # left-associate all remaining terms: ((a.b).c).d
     for term in terms[1:]:
         result = Concat(result, term)
-    # return left-associated concatenation tree
-    return result, pos
-
-# parse postfix operators (high precedence: star, plus, optional)
-def parse_postfix(s:list, pos:int):
-    # first parse the base element using highest precedence function
-    base, pos = parse_base(s, pos)
-    # keep applying postfix operators while they exist and aren't escaped
-    while pos < len(s) and s[pos][0] in '*+?' and not s[pos][1]:
-        # get the operator character
-        op = s[pos][0]
-        # skip past the operator
-        pos += 1
-        # apply kleene star (zero or more)
-        if op == '*':
-            base = Kleene(base)
-        # apply plus (one or more)
-        elif op == '+':
-            base = Plus(base)
-        # apply optional (zero or one)
-        elif op == '?':
-            base = Optional(base)
-    # return base with all postfix operators applied
-    return base, pos
-
-# parse base elements (highest precedence: characters, parentheses, character ranges)
-def parse_base(s:str, pos:int):
-    # if reached end of input, return epsilon
-    if pos >= len(s):
-        return Character(EPSILON), pos
-    # get current character and whether it's escaped (literal)
-    char, is_literal = s[pos]
-    # if opening parenthesis and not escaped
-    if char == '(' and not is_literal:
-        # skip past opening paren
-        pos += 1
-        # recursively parse inner expression starting from lowest precedence (union)
-        inner, pos = parse_union(s, pos)
-        # if closing paren exists and not escaped
-        if pos < len(s) and s[pos][0] == ')' and not s[pos][1]:
-            # skip past closing paren
-            pos += 1
-        # return parsed subexpression
-        return inner, pos
-    # if opening bracket and not escaped (character range like [a-z])
-    if char == '[' and not is_literal:
-        # skip past opening bracket
+    return result
+
+# right-associate the alternatives of a union: a|(b|(c|d))
+def union_alternatives(alternatives:list):
+    result = alternatives[-1]
+    for alternative in reversed(alternatives[:-1]):
+        result = Union(alternative, result)
+    return result
+
+# parse the inside of a bracket expression, starting right after the '['
+def parse_char_class(s:list, pos:int):
+    # a leading unescaped caret negates the class
+    negated = pos < len(s) and s[pos] == ('^', False)
+    if negated:
         pos += 1
+    # collect (first, last) ranges until the closing bracket, single characters are (c, c)
+    ranges = []
+    while pos < len(s) and s[pos] != (']', False):
         # get first character of range
         start_char = s[pos][0]
         # skip past start character
         pos += 1
-        # if dash exists (indicates range)
-        if pos < len(s) and s[pos][0] == '-':
-            # skip past dash
-            pos += 1
-            # get end character of range
-            end_char = s[pos][0]
-            # skip past end character
-            pos += 1
-            # if closing bracket exists
-            if pos < len(s) and s[pos][0] == ']':
-                # skip past closing bracket
-                pos += 1
-                # generate list of all characters in range using ascii values
-                chars = [chr(c) for c in range(ord(start_char), ord(end_char) + 1)]
-                # start with first character
-                result = Character(chars[0])
-                # union all remaining characters (a|b|c|d...)
-                for ch in chars[1:]:
-                    result = Union(result, Character(ch))
-                # return union of all characters in range
-                return result, pos
-    # if regular character (or escaped special character)
-    # skip past current character
-    pos += 1
-    # return character node
-    return Character(char), pos
+        # if an unescaped dash follows and does not close the class, this is a range
+        if pos + 1 < len(s) and s[pos] == ('-', False) and s[pos + 1] != (']', False):
+            # get end character of range and skip past the dash and end character
+            end_char = s[pos + 1][0]
+            pos += 2
+        else:
+            end_char = start_char
+        ranges.append((start_char, end_char))
+    # skip past closing bracket
+    if pos < len(s):
+        pos += 1
+    # return a single character class node
+    return CharClass(ranges, negated), pos
 
 # preprocess regex string to handle escape sequences and create token list
 def preprocess(s:str):
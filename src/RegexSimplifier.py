@@ -0,0 +1,253 @@
+from .Regex import Regex, Kleene, Optional, Plus, Concat, Union, Character, CharClass, EPSILON, chain_parts, postorder
+
+
+class RegexSimplifier:
+    # Rewrites parsed regexes into smaller equivalent ones before any automaton is
+    # built from them:
+    #   - r** = r*, (r?)* = r*, (r+)? = r*, r++ = r+, r?? = r?, eps* = eps, ...
+    #   - unions and concatenations are flattened, duplicate alternatives and
+    #     epsilons inside concatenations are dropped, and eps|r becomes r?
+    #   - alternatives with a common first element are factored: if|int|in
+    #     becomes i(f|n(t)?)
+    #   - alternatives of single characters or classes merge into one class, which
+    #     is negated when one of them is: a|[^ab] = [^b]
+    #   - long chains are rebuilt as balanced trees, so their depth is logarithmic
+    # Every node it returns is hash-consed: structurally equal subtrees are the same
+    # object, and key(node) identifies the structure.
+    def __init__(self) -> None:
+        # structure key -> the one node with that structure
+        self.nodes = {}
+        # id(node) -> structure key, for the nodes in self.nodes
+        self.keys = {}
+        self.eps = self.intern(('eps',), lambda: Character(EPSILON))
+
+    def intern(self, key: tuple, make) -> Regex:
+        node = self.nodes.get(key)
+        if node is None:
+            node = make()
+            self.nodes[key] = node
+            self.keys[id(node)] = key
+        return node
+
+    def key(self, node: Regex) -> tuple:
+        return self.keys[id(node)]
+
+    # smart constructors, they expect simplified children
+
+    def chars(self, chars: frozenset[str]) -> Regex:
+        if len(chars) == 1:
+            c = next(iter(chars))
+            return self.intern(('char', c), lambda: Character(c))
+        return self.intern(('class', chars), lambda: CharClass(self.ranges(chars)))
+
+    def other_chars(self, excluded: frozenset[str]) -> Regex:
+        # a negated class, any character except the excluded ones
+        return self.intern(('nclass', excluded), lambda: CharClass(self.ranges(excluded), negated=True))
+
+    def ranges(self, chars: frozenset[str]) -> list[tuple[str, str]]:
+        # a class is stored as sorted ranges of consecutive characters
+        ranges = []
+        for c in sorted(chars):
+            if ranges and ord(ranges[-1][1]) + 1 == ord(c):
+                ranges[-1] = (ranges[-1][0], c)
+            else:
+                ranges.append((c, c))
+        return ranges
+
+    def star(self, node: Regex) -> Regex:
+        key = self.key(node)
+        if key[0] == 'eps':
+            return node
+        if key[0] in ('star', 'plus', 'opt'):
+            # r** = (r+)* = (r?)* = r*
+            node = node.reg
+        return self.intern(('star', self.key(node)), lambda: Kleene(node))
+
+    def plus(self, node: Regex) -> Regex:
+        key = self.key(node)
+        if key[0] in ('eps', 'star', 'plus'):
+            return node
+        if key[0] == 'opt':
+            # (r?)+ = r*
+            return self.star(node.reg)
+        return self.intern(('plus', key), lambda: Plus(node))
+
+    def optional(self, node: Regex) -> Regex:
+        key = self.key(node)
+        if key[0] in ('eps', 'star', 'opt'):
+            return node
+        if key[0] == 'plus':
+            # (r+)? = r*
+            return self.star(node.reg)
+        return self.intern(('opt', key), lambda: Optional(node))
+
+    def concat(self, items: list[Regex]) -> Regex:
+        # flatten, drop the epsilons and build a balanced tree
+        flat = []
+        for item in items:
+            flat.extend(self.concat_items(item))
+        if not flat:
+            return self.eps
+        return self.balanced(flat, 'cat', Concat)
+
+    def union(self, items: list[Regex]) -> Regex:
+        # flatten and drop the duplicates, keeping the first occurrence of each
+        members = {}
+        for item in items:
+            for member in self.union_items(item):
+                members.setdefault(self.key(member), member)
+        return self.factor([(self.concat_items(member), 0) for member in members.values()])
+
+    def join(self, nullable: bool, members: list[Regex]) -> Regex:
+        # the union of factored members, plus epsilon when nullable;
+        # single characters and classes collapse into one class, where the first was;
+        # with negated classes in it, the class excludes what every negated class
+        # excludes and no other member matches
+        merged = []
+        chars = None
+        excluded = None
+        for member in members:
+            kind = self.key(member)[0]
+            if kind in ('char', 'class', 'nclass'):
+                if chars is None:
+                    chars = set()
+                    merged.append(None)
+                if kind == 'nclass':
+                    excluded = set(member.chars) if excluded is None else excluded & member.chars
+                else:
+                    chars |= member.chars if isinstance(member, CharClass) else {member.c}
+            else:
+                merged.append(member)
+        if excluded is None:
+            chars = self.chars(frozenset(chars)) if chars is not None else None
+        else:
+            chars = self.other_chars(frozenset(excluded - chars))
+        merged = [chars if member is None else member for member in merged]
+        if not merged:
+            return self.eps
+        node = self.balanced(merged, 'alt', Union)
+        return self.optional(node) if nullable else node
+
+    def factor(self, rests: list[tuple[list[Regex], int]]) -> Regex:
+        # alternatives that start with the same element share it: ab|ac = a(b|c).
+        # Every alternative is a rest, a sequence of elements from an offset on.
+        # They go into a trie with an explicit stack, then every trie node is
+        # joined bottom-up, so a long common prefix does not recurse
+        root = self.branch(rests)
+        nodes = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            for alternative in node[1]:
+                if isinstance(alternative, list):
+                    # the shared path, then the rests after it
+                    alternative[1] = self.branch(alternative[1])
+                    stack.append(alternative[1])
+        # children come after their parent in nodes
+        for node in reversed(nodes):
+            members = []
+            for alternative in node[1]:
+                if isinstance(alternative, list):
+                    path, child = alternative
+                    members.append(self.concat(path + [child[2]]))
+                else:
+                    members.append(alternative)
+            node.append(self.join(node[0], members))
+        return root[2]
+
+    def branch(self, rests: list[tuple[list[Regex], int]]) -> list:
+        # one trie node: [nullable, alternatives], where an alternative is either a
+        # finished member or [shared path, rests after the path] for several rests
+        groups = {}
+        nullable = False
+        for sequence, start in self.expand(rests):
+            if start == len(sequence):
+                nullable = True
+            else:
+                groups.setdefault(self.key(sequence[start]), []).append((sequence, start))
+        alternatives = []
+        for group in groups.values():
+            if len(group) == 1:
+                sequence, start = group[0]
+                alternatives.append(self.concat(sequence[start:]))
+                continue
+            # follow the path while every rest still starts with the same element
+            path = [group[0][0][group[0][1]]]
+            group = self.expand([(sequence, start + 1) for sequence, start in group])
+            while all(start < len(sequence) for sequence, start in group):
+                first = self.key(group[0][0][group[0][1]])
+                if any(self.key(sequence[start]) != first for sequence, start in group):
+                    break
+                path.append(group[0][0][group[0][1]])
+                group = self.expand([(sequence, start + 1) for sequence, start in group])
+            alternatives.append([path, group])
+        return [nullable, alternatives]
+
+    def expand(self, rests: list[tuple[list[Regex], int]]) -> list[tuple[list[Regex], int]]:
+        # a rest that is a single union stands for its alternatives
+        expanded = []
+        for sequence, start in rests:
+            if start == len(sequence) - 1 and self.key(sequence[start])[0] == 'alt':
+                expanded.extend((self.concat_items(member), 0) for member in self.union_items(sequence[start]))
+            else:
+                expanded.append((sequence, start))
+        return expanded
+
+    def concat_items(self, node: Regex) -> list[Regex]:
+        # the elements of a concatenation chain, without epsilons
+        items = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            kind = self.key(current)[0]
+            if kind == 'cat':
+                stack.append(current.right)
+                stack.append(current.left)
+            elif kind != 'eps':
+                items.append(current)
+        return items
+
+    def union_items(self, node: Regex) -> list[Regex]:
+        # the alternatives of a union chain
+        items = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if self.key(current)[0] == 'alt':
+                stack.append(current.right)
+                stack.append(current.left)
+            else:
+                items.append(current)
+        return items
+
+    def balanced(self, items: list[Regex], kind: str, cls) -> Regex:
+        # a tree of binary nodes over items, split in the middle at every level
+        if len(items) == 1:
+            return items[0]
+        middle = len(items) // 2
+        left = self.balanced(items[:middle], kind, cls)
+        right = self.balanced(items[middle:], kind, cls)
+        return self.intern((kind, self.key(left), self.key(right)), lambda: cls(left, right))
+
+    def simplify_node(self, regex: Regex, parts: list[Regex]) -> Regex:
+        # rebuild one node through the smart constructors, given its simplified parts
+        if isinstance(regex, Union):
+            return self.union(parts)
+        if isinstance(regex, Concat):
+            return self.concat(parts)
+        if isinstance(regex, Kleene):
+            return self.star(parts[0])
+        if isinstance(regex, Plus):
+            return self.plus(parts[0])
+        if isinstance(regex, Optional):
+            return self.optional(parts[0])
+        if isinstance(regex, CharClass):
+            return self.other_chars(regex.chars) if regex.negated else self.chars(regex.chars)
+        if isinstance(regex, Character):
+            return self.eps if regex.c == EPSILON else self.chars(frozenset(regex.c))
+        raise TypeError(f'cannot simplify {type(regex).__name__}')
+
+    def simplify(self, regex: Regex) -> Regex:
+        # rebuild the tree bottom-up, without recursion
+        return postorder(regex, chain_parts, self.simplify_node)
@@ -0,0 +1,91 @@
+from collections.abc import Iterable
+
+from .NFA import NFA, EPSILON, OTHER
+
+
+class SymbolMap(dict):
+    # ord(char) -> class id, every char outside the alphabet falls into the `other` class
+    def __init__(self, classes: dict[int, int], other: int):
+        super().__init__(classes)
+        self.other = other
+
+    def __missing__(self, key):
+        return self.other
+
+
+class SymbolClasses:
+    # A partition of an alphabet into classes of characters that behave the same way,
+    # class ids are 0..len(members)-1 and `other` is the class of every character
+    # outside the alphabet: the class holding the OTHER symbol when there is one,
+    # otherwise len(members), which no automaton has a transition on
+    def __init__(self, members: Iterable[Iterable[str]]) -> None:
+        self.members = [frozenset(chars) for chars in members]
+        self.other = len(self.members)
+        for cls, chars in enumerate(self.members):
+            if OTHER in chars:
+                self.other = cls
+        self.map = SymbolMap(
+            {ord(c): cls for cls, chars in enumerate(self.members) for c in chars if c != OTHER},
+            self.other,
+        )
+
+    @classmethod
+    def from_nfas(cls, nfas: Iterable[NFA]) -> 'SymbolClasses':
+        # two characters are equivalent when every state of every NFA moves to the same
+        # targets on both of them, so the signature of a character is the list of
+        # (nfa, state, targets) triples it labels
+        nfas = list(nfas)
+        signatures = {}
+        for idx, nfa in enumerate(nfas):
+            for (s, symbol), nxt_set in nfa.d.items():
+                if symbol == EPSILON:
+                    continue
+                signatures.setdefault(symbol, []).append((idx, s, frozenset(nxt_set)))
+            # characters in the alphabet without any transition still belong somewhere
+            for symbol in nfa.S:
+                signatures.setdefault(symbol, [])
+        # in every NFA, the characters it does not name move like its OTHER symbol
+        alphabet = set(signatures)
+        for idx, nfa in enumerate(nfas):
+            if OTHER in nfa.S:
+                moves = [(idx, s, frozenset(nxt_set)) for (s, symbol), nxt_set in nfa.d.items() if symbol == OTHER]
+                for symbol in alphabet - nfa.S:
+                    signatures[symbol].extend(moves)
+        groups = {}
+        for symbol in sorted(signatures):
+            key = frozenset(signatures[symbol])
+            groups.setdefault(key, []).append(symbol)
+        return cls(groups.values())
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def classify(self, c: str) -> int:
+        if c == OTHER:
+            return self.other
+        return self.map[ord(c)]
+
+    def collapse(self, nfa: NFA) -> NFA:
+        # relabel the transitions of an NFA with class ids; all characters of a class
+        # have the same targets, so any one of them stands for the whole class
+        d = {}
+        for (s, symbol), nxt_set in nfa.d.items():
+            key = (s, symbol if symbol == EPSILON else self.classify(symbol))
+            d.setdefault(key, set()).update(nxt_set)
+        S = {self.classify(symbol) for symbol in nfa.S}
+        if OTHER in nfa.S:
+            # the classes of characters this NFA does not name take its OTHER moves
+            moves = [(s, nxt_set) for (s, symbol), nxt_set in nfa.d.items() if symbol == OTHER]
+            for cls, chars in enumerate(self.members):
+                if chars.isdisjoint(nfa.S):
+                    S.add(cls)
+                    for s, nxt_set in moves:
+                        d.setdefault((s, cls), set()).update(nxt_set)
+        return NFA(S, set(nfa.K), nfa.q0, d, set(nfa.F))
+
+    def encode(self, word: str) -> bytes | list[int]:
+        # translate the whole word to class ids in one pass
+        translated = word.translate(self.map)
+        if len(self.members) < 256:
+            return translated.encode('latin-1')
+        return [ord(c) for c in translated]
@@ -0,0 +1,246 @@
+from .DFA import DFA
+from .DFAMatcher import DFAMatcher
+from .LazyDFA import LazyDFA
+from .NFA import NFA, NFASimulator
+from .SymbolClasses import SymbolClasses
+
+# The ways the Lexer can run its token rules. Every engine covers some of the rules
+# of the spec and answers two questions about the input (encoded as symbol class
+# ids) at a position:
+#   longest_match(codes, pos, memo) -> (end, idx, stop, reach): the end of the
+#       longest token of its rules starting at pos and that token's index in the spec
+#       ((None, None) when none of them matches), the position where the scan
+#       stopped (len(codes) if it ran out of input) and what min_reach would return,
+#       recorded on the way so that errors need no second scan (UNKNOWN when a memo
+#       hit cut the scan short); memo is a set the engine may use to remember scans
+#       that failed, so that max-munch stays linear (or None)
+#   min_reach(codes, pos) -> the earliest position where one of its rules that
+#       consumed at least one character gets stuck, None if none of them started
+
+# reach of a scan that stopped before its rules got stuck
+UNKNOWN = -1
+
+
+def remember_failures(memo: set, trail: list, last_accept: int) -> None:
+    # every (state, position) visited at or after the last accepting position
+    # leads to no further acceptance, so any later scan reaching it can stop there
+    for state, i in trail:
+        if i >= last_accept:
+            memo.add((state, i))
+
+
+class TokenDFA:
+    # a single rule, run through its own DFA
+    def __init__(self, idx: int, dfa: DFA) -> None:
+        self.idx = idx
+        self.dfa = dfa
+        # states from which the rule can no longer match
+        self.dead = dfa.dead_states()
+
+    def longest_match(self, codes: bytes | list[int], pos: int, memo: set | None = None) -> tuple[int | None, int | None, int, int | None]:
+        dfa = self.dfa
+        dead = self.dead
+        n = len(codes)
+        trail = []
+        cur = dfa.q0
+        i = pos
+        last_accept = None
+
+        # Check for epsilon acceptance (length 0)
+        if cur in dfa.F:
+            last_accept = i
+
+        cut = False
+        while i < n and (cur, codes[i]) in dfa.d:
+            if memo is not None:
+                if (cur, i) in memo:
+                    cut = True
+                    break
+                trail.append((cur, i))
+            cur = dfa.d[(cur, codes[i])]
+            # nothing longer can match once the DFA falls into a dead state
+            if cur in dead:
+                break
+            i += 1
+            if cur in dfa.F:
+                last_accept = i
+        if memo is not None:
+            remember_failures(memo, trail, pos if last_accept is None else last_accept)
+        # the rule gets stuck where the scan stopped
+        reach = UNKNOWN if cut else i if i > pos else None
+        if last_accept is None:
+            return None, None, i, reach
+        return last_accept, self.idx, i, reach
+
+    def min_reach(self, codes: bytes | list[int], pos: int) -> int | None:
+        dfa = self.dfa
+        dead = self.dead
+        n = len(codes)
+        cur = dfa.q0
+        i = pos
+        # Follow the DFA as far as possible without entering a dead state
+        while i < n and (cur, codes[i]) in dfa.d:
+            nxt = dfa.d[(cur, codes[i])]
+            if nxt in dead:
+                break
+            cur = nxt
+            i += 1
+        # Only DFAs that made at least one transition take part
+        return i if i > pos else None
+
+
+class TaggedDFA:
+    # several rules in one DFA walked through a dense table; every state has a tag
+    # (the spec index of the token it accepts, or None) and an alive bitmask of the
+    # rules that can still match from it
+    def __init__(self, dfa: DFA, tags: dict, alive: dict, symbols: SymbolClasses) -> None:
+        self.matcher = DFAMatcher(dfa, symbols)
+        self.tags = [None] * self.matcher.states
+        self.alive = [0] * self.matcher.states
+        for state, i in self.matcher.number.items():
+            self.tags[i] = tags[state]
+            self.alive[i] = alive[state]
+
+    def longest_match(self, codes: bytes | list[int], pos: int, memo: set | None = None) -> tuple[int | None, int | None, int, int | None]:
+        table, width, tags, alive = self.matcher.table, self.matcher.width, self.tags, self.alive
+        n = len(codes)
+        best_end = best_idx = None
+        trail = []
+        cur = 0
+        i = pos
+        # the rules alive after the first step, until one of them dies (see min_reach)
+        started = None
+        reach = None
+        while i < n:
+            if memo is not None:
+                # an earlier scan already went past here without accepting again
+                if (cur, i) in memo:
+                    if reach is None:
+                        reach = UNKNOWN
+                    break
+                trail.append((cur, i))
+            # -1 means no transition or a dead state, nothing longer can match
+            cur = table[cur * width + codes[i]]
+            if cur < 0:
+                break
+            if reach is None:
+                if started is None:
+                    started = alive[cur]
+                elif alive[cur] != started:
+                    reach = i
+            i += 1
+            if tags[cur] is not None:
+                best_end = i
+                best_idx = tags[cur]
+        if memo is not None:
+            remember_failures(memo, trail, pos if best_end is None else best_end)
+        if reach is None and i > pos:
+            reach = i
+        return best_end, best_idx, i, reach
+
+    def min_reach(self, codes: bytes | list[int], pos: int) -> int | None:
+        table, width, alive = self.matcher.table, self.matcher.width, self.alive
+        n = len(codes)
+        cur = 0
+        i = pos
+        started = None
+        while i < n:
+            nxt = table[cur * width + codes[i]]
+            if nxt < 0:
+                break
+            # the rules alive after the first step are the ones that started;
+            # the first time one of them dies is where it got stuck
+            if started is None:
+                started = alive[nxt]
+            elif alive[nxt] != started:
+                break
+            cur = nxt
+            i += 1
+        return i if i > pos else None
+
+
+class LazyTaggedDFA:
+    # several rules in one DFA that is determinized on the fly; the lazy DFA labels
+    # every state it builds with its (tag, alive) pair
+    def __init__(self, lazy: LazyDFA) -> None:
+        self.lazy = lazy
+
+    def longest_match(self, codes: bytes | list[int], pos: int, memo: set | None = None) -> tuple[int | None, int | None, int, int | None]:
+        lazy = self.lazy
+        step, labels, masks = lazy.step, lazy.labels, lazy.masks
+        n = len(codes)
+        best_end = best_idx = None
+        trail = []
+        cur = lazy.start
+        i = pos
+        started = None
+        reach = None
+        while i < n:
+            if memo is not None:
+                # state ids change when the cache is flushed, subsets do not
+                key = (masks[cur], i)
+                if key in memo:
+                    if reach is None:
+                        reach = UNKNOWN
+                    break
+                trail.append(key)
+            cur = step(cur, codes[i])
+            if cur < 0:
+                break
+            tag, alive = labels[cur]
+            if reach is None:
+                if started is None:
+                    started = alive
+                elif alive != started:
+                    reach = i
+            i += 1
+            if tag is not None:
+                best_end = i
+                best_idx = tag
+        if memo is not None:
+            remember_failures(memo, trail, pos if best_end is None else best_end)
+        if reach is None and i > pos:
+            reach = i
+        return best_end, best_idx, i, reach
+
+    def min_reach(self, codes: bytes | list[int], pos: int) -> int | None:
+        lazy = self.lazy
+        step, labels = lazy.step, lazy.labels
+        n = len(codes)
+        cur = lazy.start
+        i = pos
+        started = None
+        while i < n:
+            nxt = step(cur, codes[i])
+            if nxt < 0:
+                break
+            if started is None:
+                started = labels[nxt][1]
+            elif labels[nxt][1] != started:
+                break
+            cur = nxt
+            i += 1
+        return i if i > pos else None
+
+
+class TokenNFA:
+    # a single rule simulated on its NFA, for rules too big to determinize;
+    # the memo is keyed by the set of NFA states, like the lazy DFA's subsets
+    def __init__(self, idx: int, nfa: NFA) -> None:
+        self.idx = idx
+        self.simulator = NFASimulator(nfa)
+
+    def longest_match(self, codes: bytes | list[int], pos: int, memo: set | None = None) -> tuple[int | None, int | None, int, int | None]:
+        trail = []
+        end, stop, cut = self.simulator.run(codes, pos, memo, trail)
+        if memo is not None:
+            remember_failures(memo, trail, pos if end < 0 else end)
+        # the simulation stops where the rule gets stuck
+        reach = UNKNOWN if cut else stop if stop > pos else None
+        if end < 0:
+            return None, None, stop, reach
+        return end, self.idx, stop, reach
+
+    def min_reach(self, codes: bytes | list[int], pos: int) -> int | None:
+        i = self.simulator.reach(codes, pos)
+        return i if i > pos else None
@@ -0,0 +1,73 @@
+from array import array
+from collections.abc import Iterable, Iterator
+
+from .LineIndex import LineIndex
+
+
+class TokenSpans:
+    # The tokens of one input as three parallel columns: the index in the spec of
+    # every token's rule, and its start and end offsets in the text. Lexemes are not
+    # copied out of the text; they are sliced only when a token is looked at, so
+    # consumers that only need the token types allocate no strings at all.
+    # error is the lexer's error message, the tokens before the error are kept.
+    def __init__(self, text: str, names: list[str]) -> None:
+        self.text = text
+        # spec index -> token name
+        self.names = names
+        self.kinds = array('I')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.error = None
+        # newline offsets of text, only built when a position is asked for
+        self.line_index = None
+
+    def append(self, kind: int, start: int, end: int) -> None:
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def name(self, i: int) -> str:
+        return self.names[self.kinds[i]]
+
+    def lexeme(self, i: int) -> str:
+        return self.text[self.starts[i]:self.ends[i]]
+
+    @property
+    def lines(self) -> LineIndex:
+        if self.line_index is None:
+            self.line_index = LineIndex(self.text)
+        return self.line_index
+
+    def position(self, i: int) -> tuple[int, int]:
+        # line and column where the i-th token starts
+        return self.lines.position(self.starts[i])
+
+    def located(self) -> list[tuple[str, str, int, int]]:
+        # every token as (name, lexeme, line, column)
+        text, names = self.text, self.names
+        return [(names[kind], text[start:end], line, col)
+                for kind, start, end, (line, col)
+                in zip(self.kinds, self.starts, self.ends, self.lines.positions(self.starts))]
+
+    def __getitem__(self, i: int) -> tuple[str, str]:
+        # the i-th token as lex() returns it
+        return self.name(i), self.lexeme(i)
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        text, names = self.text, self.names
+        for kind, start, end in zip(self.kinds, self.starts, self.ends):
+            yield names[kind], text[start:end]
+
+    def tokens(self, exclude: Iterable[str] = ()) -> list[tuple[str, str]]:
+        # the result of lex(): the (name, lexeme) pairs, or only the error;
+        # tokens named in exclude are skipped without slicing their lexemes
+        if self.error is not None:
+            return [("", self.error)]
+        text, names = self.text, self.names
+        exclude = set(exclude)
+        skip = {kind for kind, name in enumerate(names) if name in exclude}
+        return [(names[kind], text[start:end])
+                for kind, start, end in zip(self.kinds, self.starts, self.ends) if kind not in skip]
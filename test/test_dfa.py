@@ -0,0 +1,147 @@
+import random
+import unittest
+
+from src.DFA import DFA
+from src.DFAMatcher import DFAMatcher
+from src.LazyDFA import LazyDFA
+from src.Regex import parse_regex
+
+
+class DFATests(unittest.TestCase):
+    def test_dead_states_contain_sink(self):
+        subsets = {}
+        dfa = parse_regex('ab').thompson().subset_construction(subsets)
+        sink = next(state for state, subset in subsets.items() if not subset)
+        dead = dfa.dead_states()
+        self.assertIn(sink, dead)
+        self.assertTrue(dead.isdisjoint(dfa.F))
+        self.assertNotIn(dfa.q0, dead)
+
+    def test_dead_states_without_final_states(self):
+        dfa = DFA({'a'}, {0, 1}, 0, {(0, 'a'): 1, (1, 'a'): 1}, set())
+        self.assertEqual(dfa.dead_states(), {0, 1})
+        self.assertFalse(dfa.accept('aaa'))
+
+    def test_dfa_filled_in_place(self):
+        dfa = DFA({'a'}, {0, 1}, 0, {}, set())
+        dfa.d[(0, 'a')] = 1
+        dfa.F.add(1)
+        self.assertEqual(dfa.dead_states(), set())
+        self.assertTrue(dfa.accept('a'))
+        self.assertTrue(DFAMatcher(dfa).accept('a'))
+
+    def test_accept_stops_in_dead_state(self):
+        dfa = parse_regex('a(b|c)*').thompson().subset_construction()
+        self.assertTrue(dfa.accept('abcbc'))
+        self.assertFalse(dfa.accept('b' + 'a' * 1000))
+        self.assertFalse(dfa.accept(''))
+        # the walk stops at most one lap around the states after entering the sink
+        read = []
+
+        def word():
+            for c in 'b' + 'a' * 1000:
+                read.append(c)
+                yield c
+
+        self.assertFalse(dfa.accept(word()))
+        self.assertLessEqual(len(read), len(dfa.K) + 1)
+
+    def test_trim(self):
+        # 2 is unreachable and 3 can never accept
+        dfa = DFA({'a', 'b'}, {0, 1, 2, 3}, 0,
+                  {(0, 'a'): 1, (0, 'b'): 3, (1, 'a'): 1, (1, 'b'): 3, (2, 'a'): 1, (3, 'a'): 3, (3, 'b'): 3},
+                  {1})
+        trimmed, removed = dfa.trim()
+        self.assertEqual(removed, 2)
+        self.assertEqual(trimmed.K, {0, 1})
+        self.assertEqual(trimmed.d, {(0, 'a'): 1, (1, 'a'): 1})
+        for word in ['a', 'aa', 'ab', 'b', '']:
+            self.assertEqual(trimmed.accept(word), dfa.accept(word))
+
+    def test_minimize_large_cycle(self):
+        # a cycle of 3000 states accepting every even count collapses to 2 states
+        n = 3000
+        dfa = DFA({'a', 'b'}, set(range(n)), 0,
+                  {**{(s, 'a'): (s + 1) % n for s in range(n)}, **{(s, 'b'): s for s in range(n)}},
+                  {s for s in range(n) if s % 2 == 0})
+        minimized = dfa.minimize()
+        self.assertEqual(len(minimized.K), 2)
+        self.assertTrue(minimized.accept('abbab'))
+        self.assertFalse(minimized.accept('ab'))
+
+    def test_minimize_partial_dfa(self):
+        # state 2 can never accept, so it is equivalent to the missing transitions
+        dfa = DFA({'a', 'b'}, {0, 1, 2}, 0, {(0, 'a'): 1, (0, 'b'): 2, (2, 'a'): 2}, {1})
+        minimized = dfa.minimize()
+        self.assertEqual(len(minimized.K), 3)
+        for word in ['a', 'b', 'ab', 'ba', '']:
+            self.assertEqual(minimized.accept(word), dfa.accept(word))
+
+    def test_minimize_keeps_keys_apart(self):
+        # 1 and 2 accept the same words but carry different keys
+        dfa = DFA({'a'}, {0, 1, 2}, 0, {(0, 'a'): 1, (1, 'a'): 2, (2, 'a'): 2}, {1, 2})
+        self.assertEqual(len(dfa.minimize().K), 2)
+        groups = {}
+        minimized = dfa.minimize(key=lambda s: s == 2, groups=groups)
+        self.assertEqual(len(minimized.K), 3)
+        self.assertEqual(set(groups), {0, 1, 2})
+        self.assertEqual(minimized.d[(groups[1], 'a')], groups[2])
+
+
+class DFAMatcherTests(unittest.TestCase):
+    def test_matcher_agrees_with_dfa(self):
+        dfa = parse_regex('(a|b)*abb|c+').thompson().subset_construction()
+        matcher = DFAMatcher(dfa)
+        words = ['', 'abb', 'babb', 'ab', 'ccc', 'cab', 'abbc', 'x', 'abbx']
+        self.assertEqual(matcher.accept_many(words), [dfa.accept(word) for word in words])
+
+    def test_matcher_symbol_classes(self):
+        dfa = parse_regex('[a-z]+').thompson().subset_construction().minimize()
+        matcher = DFAMatcher(dfa)
+        # all letters share one class, plus the class for unknown characters
+        self.assertEqual(matcher.width, 2)
+        self.assertTrue(matcher.accept('hello' * 1000))
+        self.assertFalse(matcher.accept('hello world'))
+
+    def test_match_prefix(self):
+        matcher = DFAMatcher(parse_regex('a+b?').thompson().subset_construction())
+        self.assertEqual(matcher.match_prefix('aaabx'), 4)
+        self.assertEqual(matcher.match_prefix('xaab', 1), 4)
+        self.assertEqual(matcher.match_prefix('ba'), -1)
+        self.assertEqual(matcher.match_prefix('aab', 3), -1)
+
+
+class LazyDFATests(unittest.TestCase):
+    def test_lazy_agrees_with_dfa(self):
+        nfa = parse_regex('(a|b)*abb|c+').thompson()
+        dfa = nfa.subset_construction()
+        lazy = LazyDFA(nfa)
+        words = ['', 'abb', 'babb', 'ab', 'ccc', 'cab', 'abbc', 'x', 'abbx']
+        self.assertEqual(lazy.accept_many(words), [dfa.accept(word) for word in words])
+        self.assertEqual(lazy.match_prefix('xabbab', 1), 4)
+        self.assertEqual(lazy.match_prefix('ba'), -1)
+
+    def test_only_visited_states_are_built(self):
+        # the n-th letter from the end is an a: 2^n DFA states, few of them on one word
+        nfa = parse_regex('(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)').thompson()
+        lazy = LazyDFA(nfa)
+        self.assertTrue(lazy.accept('b' * 50 + 'a' + 'b' * 8))
+        self.assertLessEqual(len(lazy.masks), 11)
+        self.assertEqual(lazy.flushes, 0)
+
+    def test_bounded_cache(self):
+        nfa = parse_regex('(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)').thompson()
+        dfa = nfa.subset_construction()
+        lazy = LazyDFA(nfa, max_states=4)
+        rng = random.Random(0)
+        for _ in range(200):
+            word = ''.join(rng.choice('ab') for _ in range(rng.randrange(12)))
+            self.assertEqual(lazy.accept(word), dfa.accept(word))
+            self.assertLessEqual(len(lazy.masks), 4)
+        self.assertGreater(lazy.flushes, 0)
+        with self.assertRaises(ValueError):
+            LazyDFA(nfa, max_states=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
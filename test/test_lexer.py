@@ -0,0 +1,219 @@
+import io
+import json
+import random
+import unittest
+
+from src.Lexer import BYTES_PER_ENTRY, Lexer
+
+SPECS = [
+    ([("SPACE", "\\ "), ("NEWLINE", "\n"), ("ABC", "a(b+)c"), ("AS", "a+"), ("BCS", "(bc)+"), ("DORC", "(d|c)+")], "abcd \n"),
+    ([("ones", "11+"), ("pair", "01|10"), ("other", "0|1")], "01 "),
+    ([("A", "a+"), ("AB", "(ab)+"), ("E", "b?"), ("X", "a*b*c")], "abcx"),
+]
+
+
+class LexerTests(unittest.TestCase):
+    def assertSameTokens(self, reference: Lexer, lexer: Lexer, alphabet: str, lex=None) -> None:
+        # compare against the per-token lexer on random inputs
+        rng = random.Random(0)
+        lex = lex or lexer.lex
+        for _ in range(500):
+            word = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+            self.assertEqual(lex(word), reference.lex(word), f'different result on {word!r}')
+
+    def test_combined_matches_per_token(self):
+        for spec, alphabet in SPECS:
+            self.assertSameTokens(Lexer(spec, combined=False), Lexer(spec), alphabet)
+
+    def test_linear_matches_per_token(self):
+        for spec, alphabet in SPECS:
+            reference = Lexer(spec, combined=False)
+            self.assertSameTokens(reference, Lexer(spec, linear=True), alphabet)
+            self.assertSameTokens(reference, Lexer(spec, combined=False, linear=True), alphabet)
+
+    def test_linear_backtracking_input(self):
+        lexer = Lexer([("A", "a"), ("B", "b"), ("ABC", "(ab)*c")], linear=True)
+        self.assertEqual(lexer.lex("ab" * 2000), [("A", "a"), ("B", "b")] * 2000)
+        self.assertEqual(lexer.lex("ababc"), [("ABC", "ababc")])
+
+    def test_lazy_matches_per_token(self):
+        for spec, alphabet in SPECS:
+            reference = Lexer(spec, combined=False)
+            self.assertSameTokens(reference, Lexer(spec, lazy=True), alphabet)
+            # a tiny cache is flushed all the time and must still give the same tokens
+            self.assertSameTokens(reference, Lexer(spec, lazy=True, max_states=2, linear=True), alphabet)
+
+    def test_glushkov_matches_per_token(self):
+        for spec, alphabet in SPECS:
+            reference = Lexer(spec, combined=False)
+            self.assertSameTokens(reference, Lexer(spec, construction='glushkov'), alphabet)
+            self.assertSameTokens(reference, Lexer(spec, construction='glushkov', lazy=True), alphabet)
+
+    def test_parallel_compile(self):
+        for spec, alphabet in SPECS:
+            self.assertSameTokens(Lexer(spec), Lexer(spec, workers=4), alphabet)
+
+    def test_combined_priority(self):
+        lexer = Lexer([("IF", "if"), ("ID", "[a-z]+"), ("SPACE", "\\ ")])
+        self.assertEqual(
+            lexer.lex("if iff"),
+            [("IF", "if"), ("SPACE", " "), ("ID", "iff")],
+        )
+
+    def test_negated_class_matches_any_character(self):
+        # E names é, STR only excludes ": characters no rule names still take [^"]
+        spec = [("E", "é"), ("STR", '"[^"]*"'), ("SPACE", "\\ ")]
+        lexers = [Lexer(spec), Lexer(spec, combined=False), Lexer(spec, lazy=True),
+                  Lexer(spec, memory_budget=0, linear=True), Lexer(spec, construction='glushkov')]
+        for lexer in lexers:
+            self.assertEqual(lexer.lex('"café" é "\x0b☃"'),
+                             [("STR", '"café"'), ("SPACE", " "), ("E", "é"), ("SPACE", " "), ("STR", '"\x0b☃"')])
+            self.assertEqual(lexer.lex('"aé'), [("", "No viable alternative at character 2, line 0")])
+            self.assertEqual(lexer.lex('☃'), [("", "No viable alternative at character 0, line 0")])
+
+    def test_combined_lexer_spec(self):
+        with open("lexer_spec.json", "r") as f:
+            spec = list(json.load(f).items())
+        lexer = Lexer(spec)
+        self.assertEqual(
+            lexer.lex("\\x.(x + 12)"),
+            [("LAMBDA", "\\"), ("VAR", "x"), ("POINT", "."), ("LPAREN", "("), ("VAR", "x"),
+             ("SPACE", " "), ("OP", "+"), ("SPACE", " "), ("NUMBER", "12"), ("RPAREN", ")")],
+        )
+
+    def test_budget_plan(self):
+        spec = [("A", "a+"), ("BAD", "(a|b)*a" + "(a|b)" * 12), ("B", "b")]
+        lexer = Lexer(spec, memory_budget=20000)
+        self.assertEqual([rule.engine for rule in lexer.plan], ["dfa", "lazy", "dfa"])
+        self.assertIsNone(lexer.plan[1].dfa_states)
+        self.assertEqual(lexer.plan[0].dfa_states, 2)
+        # no room for a lazy cache either
+        lexer = Lexer(spec, memory_budget=200)
+        self.assertEqual([rule.engine for rule in lexer.plan], ["dfa", "nfa", "dfa"])
+        self.assertEqual(Lexer(spec).lex("ab"), lexer.lex("ab"))
+
+    def test_budget_with_nullable_rule(self):
+        # rules that only match the empty word still need a state
+        for spec in [[("E", "()"), ("A", "ab")], [("E", "(())*"), ("A", "ab")]]:
+            for budget in [0, 8, 40]:
+                for combined in [True, False]:
+                    lexer = Lexer(spec, memory_budget=budget, combined=combined)
+                    row = BYTES_PER_ENTRY * (len(lexer.symbols) + 1)
+                    eager = [rule.dfa_states for rule in lexer.plan if rule.engine == "dfa"]
+                    self.assertLessEqual(sum(eager) * row, budget)
+                    self.assertEqual(lexer.lex("abab"), [("A", "ab")] * 2)
+            self.assertEqual([rule.engine for rule in Lexer(spec, memory_budget=0).plan], ["nfa", "nfa"])
+
+    def test_budget_matches_per_token(self):
+        for spec, alphabet in SPECS:
+            reference = Lexer(spec, combined=False)
+            for budget in [0, 300, 3000]:
+                self.assertSameTokens(reference, Lexer(spec, memory_budget=budget), alphabet)
+                self.assertSameTokens(reference, Lexer(spec, memory_budget=budget, linear=True), alphabet)
+
+    def test_linear_budget_fallback_to_nfa(self):
+        lexer = Lexer([("A", "a"), ("X", "a*b")], memory_budget=0, linear=True)
+        self.assertEqual([rule.engine for rule in lexer.plan], ["nfa", "nfa"])
+
+        class CountingCodes(list):
+            # every step of a scan reads one symbol
+            reads = 0
+
+            def __getitem__(self, i):
+                CountingCodes.reads += 1
+                return super().__getitem__(i)
+
+        for n in [1000, 4000]:
+            codes = CountingCodes(lexer.symbols.encode("a" * n))
+            failed = [set() for _ in lexer.engines]
+            CountingCodes.reads = 0
+            pos = 0
+            while pos < n:
+                pos = lexer.longest_match(codes, pos, failed)[0]
+            # without the memo every scan would run to the end of the input
+            self.assertLessEqual(CountingCodes.reads, 4 * n)
+        self.assertEqual(lexer.lex("a" * 3000), [("A", "a")] * 3000)
+
+    def test_reach_recorded_by_longest_match(self):
+        rng = random.Random(0)
+        for spec, alphabet in SPECS:
+            for lexer in [Lexer(spec), Lexer(spec, combined=False), Lexer(spec, lazy=True), Lexer(spec, memory_budget=0)]:
+                for _ in range(200):
+                    word = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+                    codes = lexer.symbols.encode(word)
+                    pos = rng.randrange(len(word))
+                    self.assertEqual(lexer.longest_match(codes, pos)[3], lexer.min_reach(codes, pos), (word, pos))
+
+    def test_spans(self):
+        lexer = Lexer([("ID", "[a-z]+"), ("NUM", "[0-9]+"), ("SPACE", "\\ ")])
+        spans = lexer.lex_spans("ab 12 c")
+        self.assertEqual(list(spans.kinds), [0, 2, 1, 2, 0])
+        self.assertEqual(list(spans.starts), [0, 2, 3, 5, 6])
+        self.assertEqual(list(spans.ends), [2, 3, 5, 6, 7])
+        self.assertEqual(spans[2], ("NUM", "12"))
+        self.assertEqual(list(spans), lexer.lex("ab 12 c"))
+        self.assertEqual(spans.tokens(exclude={"SPACE"}), [("ID", "ab"), ("NUM", "12"), ("ID", "c")])
+        # the tokens before an error are kept, tokens() only returns the error
+        spans = lexer.lex_spans("ab !")
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans.tokens(), lexer.lex("ab !"))
+
+    def test_error_at_first_dead_character(self):
+        # the error is the first character no rule can continue with, the scan
+        # does not walk the sink state to the end of the input
+        spec = [("AB", "ab"), ("SPACE", "\\ "), ("NEWLINE", "\n")]
+        for lexer in [Lexer(spec), Lexer(spec, combined=False), Lexer(spec, lazy=True),
+                      Lexer(spec, memory_budget=0), Lexer(spec, linear=True)]:
+            self.assertEqual(lexer.lex("aaaa"), [("", "No viable alternative at character 1, line 0")])
+            self.assertEqual(lexer.lex("ab aab"), [("", "No viable alternative at character 4, line 0")])
+            self.assertEqual(lexer.lex("ab\naa\nab"), [("", "No viable alternative at character 1, line 1")])
+            self.assertEqual(list(lexer.lex_stream(["ab a", "ab"]))[-1],
+                             ("", "No viable alternative at character 4, line 0"))
+
+    def test_token_positions(self):
+        lexer = Lexer([("ID", "[a-z]+"), ("SPACE", "\\ "), ("NEWLINE", "\n")])
+        text = "ab c\n\nde\nf  g"
+        located = lexer.lex_spans(text).located()
+        self.assertEqual(
+            [(lexeme, line, col) for name, lexeme, line, col in located if name == "ID"],
+            [("ab", 0, 0), ("c", 0, 3), ("de", 2, 0), ("f", 3, 0), ("g", 3, 3)],
+        )
+        self.assertEqual(lexer.lex_spans(text).position(5), (2, 0))
+        # the stream gives the same positions, whatever the chunks
+        self.assertEqual(list(lexer.lex_stream(io.StringIO(text), 3, positions=True)), located)
+        # the error is a 4-tuple too, at the line and column of the error
+        tokens = list(lexer.lex_stream(io.StringIO("ab\ncd 1"), 3, positions=True))
+        for name, lexeme, line, col in tokens:
+            self.assertIsInstance(line, int)
+        self.assertEqual(tokens[-1], ("", "No viable alternative at character 3, line 1", 1, 3))
+        self.assertEqual(list(lexer.lex_stream(["a", "b1"], positions=True))[-1],
+                         ("", "No viable alternative at character 2, line 0", 0, 2))
+
+    def test_stream_matches_lex(self):
+        def lex_stream(lexer, chunk_size):
+            def lex(word):
+                tokens = list(lexer.lex_stream(io.StringIO(word), chunk_size))
+                # lex() only returns the error, the stream yields it after the tokens
+                return tokens[-1:] if tokens and tokens[-1][0] == "" else tokens
+            return lex
+        for spec, alphabet in SPECS:
+            for lexer in [Lexer(spec), Lexer(spec, linear=True), Lexer(spec, memory_budget=300)]:
+                for chunk_size in [1, 3, 64]:
+                    self.assertSameTokens(lexer, lexer, alphabet, lex_stream(lexer, chunk_size))
+
+    def test_stream_tokens_across_chunks(self):
+        lexer = Lexer([("ID", "[a-z]+"), ("SPACE", "\\ "), ("NEWLINE", "\n")])
+        chunks = ["ab", "c d", "", "e" * 50, "\nf"]
+        self.assertEqual(
+            list(lexer.lex_stream(chunks)),
+            [("ID", "abc"), ("SPACE", " "), ("ID", "d" + "e" * 50), ("NEWLINE", "\n"), ("ID", "f")],
+        )
+        # error positions count the lines and columns of the text already lexed
+        self.assertEqual(
+            list(lexer.lex_stream(io.StringIO("ab\ncd ef1"), 2))[-2:],
+            [("ID", "ef"), ("", "No viable alternative at character 5, line 1")],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import random
+import unittest
+
+from src.NFA import NFA, SparseSet, StateBudgetExceeded
+from src.Regex import parse_regex
+from src.SymbolClasses import SymbolClasses
+
+
+class NFATests(unittest.TestCase):
+    def example_nfa(self) -> NFA[int]:
+        return NFA(
+            {'a', 'b'},
+            {0, 1, 2, 3, 4, 5, 6},
+            0,
+            {
+                (0, ''): {1, 2},
+                (1, ''): {0},
+                (2, ''): {4, 6},
+                (3, ''): {1},
+                (4, 'a'): {5},
+                (5, ''): {3},
+                (6, 'b'): {7},
+                (7, ''): {3}
+            },
+            {1},
+        )
+
+    def test_epsilon_closures_match_single_closures(self):
+        for nfa in (self.example_nfa(), parse_regex('(a*|b+)*(c?d)+').thompson()):
+            closures = nfa.epsilon_closures()
+            self.assertEqual(set(closures), nfa.states())
+            for state in nfa.states():
+                self.assertEqual(closures[state], nfa.epsilon_closure(state))
+
+    def test_epsilon_cycle_shares_closure(self):
+        closures = self.example_nfa().epsilon_closures()
+        self.assertIs(closures[0], closures[1])
+        self.assertEqual(closures[5], {5, 3, 1, 0, 2, 4, 6})
+
+    def test_subset_construction_numbers_states(self):
+        subsets = {}
+        dfa = parse_regex('ab*').thompson().subset_construction(subsets)
+        self.assertEqual(dfa.K, set(range(len(dfa.K))))
+        self.assertEqual(dfa.q0, 0)
+        self.assertEqual(set(subsets), dfa.K)
+        # the sink is the empty subset
+        self.assertIn(frozenset(), subsets.values())
+        self.assertTrue(dfa.remap_states(subsets.__getitem__).accept('abbb'))
+
+    def test_bitset_subset_construction(self):
+        for nfa in (self.example_nfa(), parse_regex('(a|b)*a(a|b)(a|b)').thompson()):
+            subsets, reference_subsets = {}, {}
+            dfa = nfa.subset_construction_bitset(subsets)
+            reference = nfa.subset_construction(reference_subsets)
+            # both number the states in the same BFS order
+            self.assertEqual(dfa, reference)
+            self.assertEqual(subsets, reference_subsets)
+
+    def test_trim(self):
+        # 3 is unreachable and 4 can never reach the final state
+        nfa = NFA({'a', 'b'}, {0, 1, 2, 3, 4}, 0,
+                  {(0, ''): {1, 4}, (1, 'a'): {2}, (3, 'b'): {2}, (4, 'b'): {4}}, {2})
+        trimmed, removed = nfa.trim()
+        self.assertEqual(removed, 2)
+        self.assertEqual(trimmed.K, {0, 1, 2})
+        self.assertEqual(trimmed.d, {(0, ''): {1}, (1, 'a'): {2}})
+
+    def test_subset_construction_budget(self):
+        nfa = parse_regex('(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)').thompson()
+        # 2^7 subsets plus the sink do not fit in 100 states
+        with self.assertRaises(StateBudgetExceeded):
+            nfa.subset_construction(max_states=100)
+        with self.assertRaises(StateBudgetExceeded):
+            nfa.subset_construction_bitset(max_states=100)
+        self.assertEqual(len(nfa.subset_construction(max_states=1000).K),
+                         len(nfa.subset_construction().K))
+        # the initial state counts too: () has a single DFA state
+        empty = parse_regex('()').thompson()
+        self.assertEqual(len(empty.subset_construction(max_states=1).K), 1)
+        with self.assertRaises(StateBudgetExceeded):
+            empty.subset_construction(max_states=0)
+        with self.assertRaises(StateBudgetExceeded):
+            empty.subset_construction_bitset(max_states=0)
+
+
+class NFASimulatorTests(unittest.TestCase):
+    def test_sparse_set(self):
+        members = SparseSet(10)
+        for x in [3, 7, 3, 0]:
+            members.add(x)
+        self.assertEqual(list(members), [3, 7, 0])
+        self.assertIn(7, members)
+        self.assertNotIn(5, members)
+        members.clear()
+        self.assertEqual(len(members), 0)
+        self.assertNotIn(3, members)
+
+    def test_simulation_agrees_with_dfa(self):
+        nfa = parse_regex('(a|b)*abb|c+|[x-z]*').thompson()
+        dfa = nfa.subset_construction()
+        rng = random.Random(0)
+        for _ in range(500):
+            word = ''.join(rng.choice('abcxq') for _ in range(rng.randrange(10)))
+            self.assertEqual(nfa.accept(word), dfa.accept(word), word)
+
+    def test_match_prefix(self):
+        nfa = parse_regex('a+b?').thompson()
+        self.assertEqual(nfa.match_prefix('aaabx'), 4)
+        self.assertEqual(nfa.match_prefix('xaab', 1), 4)
+        self.assertEqual(nfa.match_prefix('ba'), -1)
+        self.assertEqual(parse_regex('a*').thompson().match_prefix('b'), 0)
+
+
+class SymbolClassesTests(unittest.TestCase):
+    def test_classes_over_spec(self):
+        nfas = [parse_regex(r).thompson() for r in ('[a-z]+', '[0-9]+', 'if', '\\+|\\-')]
+        symbols = SymbolClasses.from_nfas(nfas)
+        # i, f, the other letters, digits, + and -
+        self.assertEqual(len(symbols), 6)
+        self.assertEqual(symbols.classify('a'), symbols.classify('z'))
+        self.assertNotEqual(symbols.classify('i'), symbols.classify('a'))
+        self.assertEqual(symbols.classify('?'), symbols.other)
+        self.assertEqual(list(symbols.encode('a1?')), [symbols.classify('a'), symbols.classify('1'), symbols.other])
+
+    def test_collapsed_dfa_accepts_same_words(self):
+        nfa = parse_regex('[a-z]([a-z]|[0-9])*').thompson()
+        symbols = SymbolClasses.from_nfas([nfa])
+        dfa = symbols.collapse(nfa).subset_construction().minimize()
+        self.assertLessEqual(len(dfa.S), 2)
+        for word in ['a', 'ab9', '9a', '', 'a?']:
+            self.assertEqual(dfa.accept(list(symbols.encode(word))), nfa.subset_construction().accept(word))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+import random
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from src.DFAMatcher import DFAMatcher
+from src.Derivatives import DerivativeMatcher, TermTable
+from src.Lexer import Lexer
+from src.NFA import NFASimulator, StateAllocator
+from src.Regex import CharClass, Character, Concat, Kleene, Optional, Regex, chain_parts, parse_regex
+
+
+class RegexTests(unittest.TestCase):
+    def accepts(self, regex: str, words: list[str]) -> list[bool]:
+        dfa = parse_regex(regex).thompson().subset_construction()
+        return [dfa.accept(word) for word in words]
+
+    def test_char_class_is_single_node(self):
+        regex = parse_regex('[a-zA-Z0-9_]')
+        self.assertIsInstance(regex, CharClass)
+        self.assertEqual(len(regex.chars), 63)
+        nfa = regex.thompson()
+        self.assertEqual(len(nfa.K), 2)
+        self.assertNotIn('', {symbol for _, symbol in nfa.d})
+
+    def test_char_class_ranges_and_singles(self):
+        self.assertEqual(
+            self.accepts('[a-cx_]+', ['abc', 'x_a', 'd', '', 'ax-']),
+            [True, True, False, False, False],
+        )
+
+    def test_negated_char_class(self):
+        self.assertEqual(
+            self.accepts('[^0-9]+', ['abc', 'a b', 'a1', '5']),
+            [True, True, False, False],
+        )
+        # every character outside the class, not only printable ascii
+        regex = parse_regex('[^a]b')
+        words = ['éb', '\x0bb', '\U0001f600b', 'ab', 'é']
+        expected = [True, True, True, False, False]
+        self.assertEqual(self.accepts('[^a]b', words), expected)
+        for nfa in [regex.thompson(), regex.glushkov(), regex.simplify().thompson()]:
+            self.assertEqual([nfa.accept(word) for word in words], expected)
+        self.assertEqual([regex.followpos_dfa().accept(word) for word in words], expected)
+        for method in ['thompson', 'followpos', 'derivatives']:
+            self.assertEqual(regex.compile(method=method).accept_many(words), expected, method)
+        self.assertEqual(regex.compile(max_states=1).accept_many(words), expected)
+
+    def test_char_class_escapes(self):
+        self.assertEqual(
+            self.accepts('[\\-\\]a]', ['-', ']', 'a', 'b']),
+            [True, True, True, False],
+        )
+
+    def test_thompson_states_are_complete(self):
+        nfa = parse_regex('(a|b)*c?d+').thompson()
+        # every state used by a transition is part of K
+        self.assertEqual(nfa.states(), nfa.K)
+        self.assertEqual(len(nfa.F), 1)
+
+    def test_large_alternation(self):
+        words = [f'{chr(97 + i % 26)}{chr(97 + i // 26 % 26)}x' for i in range(300)]
+        nfa = parse_regex('|'.join(words)).thompson()
+        # linear in the size of the regex: two states per union and per character
+        self.assertEqual(len(nfa.K), 2 * 299 + 6 * 300)
+        dfa = nfa.subset_construction()
+        self.assertTrue(dfa.accept('kbx'))
+        self.assertFalse(dfa.accept('kb'))
+
+    def test_deep_regexes_do_not_recurse(self):
+        # far deeper than the interpreter's recursion limit
+        words = [f'{chr(97 + i % 26)}{chr(97 + i // 26 % 26)}{chr(97 + i // 676 % 26)}x' for i in range(3000)]
+        alternation = parse_regex('|'.join(words))
+        self.assertTrue(alternation.glushkov().accept('kbax'))
+        literal = parse_regex('(' * 100 + 'a' * 5000 + ')' * 100)
+        nfa = literal.thompson()
+        self.assertTrue(nfa.accept('a' * 5000))
+        self.assertFalse(nfa.accept('a' * 4999))
+        for method in ['thompson', 'followpos', 'derivatives']:
+            matcher = literal.compile(method=method)
+            self.assertEqual(matcher.match_prefix('a' * 5001), 5000, method)
+        # a chain of nullable heads: every derivative goes down the whole chain
+        self.assertTrue(parse_regex('a?' * 2000).compile(method='derivatives').accept('a'))
+        matcher = DerivativeMatcher.from_regex(parse_regex('(a|b)?' * 2000))
+        self.assertEqual(matcher.accept_many(['', 'abba', 'abc']), [True, True, False])
+        # terms copied from another table
+        stars = DerivativeMatcher.from_regex(parse_regex('a*'))
+        matcher = stars.intersection(DerivativeMatcher.from_regex(literal))
+        self.assertEqual(matcher.accept_many(['a' * 5000, 'a' * 4999]), [True, False])
+        # two long alternatives with a common prefix, factored by the simplifier
+        shared = parse_regex('a' * 5000 + 'b|' + 'a' * 5000 + 'c')
+        for method in ['thompson', 'followpos', 'derivatives']:
+            matcher = shared.compile(method=method)
+            self.assertEqual(matcher.accept_many(['a' * 5000 + 'c', 'a' * 5000]), [True, False], method)
+        lexer = Lexer([('K', 'a' * 5000 + 'b|' + 'a' * 5000 + 'c')])
+        self.assertEqual(lexer.lex('a' * 5000 + 'b'), [('K', 'a' * 5000 + 'b')])
+
+    def test_shared_allocator_across_threads(self):
+        allocator = StateAllocator()
+        regexes = [parse_regex(r) for r in ['(a|b)*c', '[0-9]+', 'abc?', 'x*y+'] * 25]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            nfas = list(pool.map(lambda regex: regex.thompson(allocator), regexes))
+        seen = set()
+        for nfa in nfas:
+            self.assertTrue(seen.isdisjoint(nfa.K))
+            seen |= nfa.K
+        # every compilation without an allocator starts again from 0
+        self.assertEqual(min(parse_regex('ab').thompson().K), 0)
+
+    def test_compile_falls_back_to_simulation(self):
+        regex = parse_regex('(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)')
+        self.assertIsInstance(regex.compile(), DFAMatcher)
+        matcher = regex.compile(max_states=50)
+        self.assertIsInstance(matcher, NFASimulator)
+        self.assertEqual(matcher.accept_many(['a' + 'b' * 8, 'b' * 9, 'ba']), [True, False, False])
+        self.assertEqual(matcher.match_prefix('xa' + 'b' * 10, 1), 10)
+
+    def test_followpos_dfa_agrees_with_subset_construction(self):
+        rng = random.Random(0)
+        for regex_str in ['(a|b)*abb', 'a*', '(ab|a)*b?', '[a-c]+x|y*', 'a?b?', '((a|)b)*', '(a*)*b']:
+            regex = parse_regex(regex_str)
+            direct = regex.followpos_dfa()
+            dfa = regex.thompson().subset_construction()
+            # the direct construction never needs more states
+            self.assertLessEqual(len(direct.K), len(dfa.K))
+            for _ in range(200):
+                word = ''.join(rng.choice('abcxy') for _ in range(rng.randrange(7)))
+                self.assertEqual(direct.accept(word), dfa.accept(word), (regex_str, word))
+
+    def test_glushkov_one_state_per_position(self):
+        rng = random.Random(0)
+        for regex_str in ['(a|b)*abb', 'a*', '(ab|a)*b?', '[a-c]+x|y*', 'a?b?', '((a|)b)*', '']:
+            regex = parse_regex(regex_str)
+            nfa = regex.glushkov()
+            positions = sum(c not in '()|*+?' for c in regex_str.replace('[a-c]', 'c'))
+            self.assertEqual(len(nfa.K), positions + 1)
+            self.assertNotIn('', {symbol for _, symbol in nfa.d})
+            dfa = regex.thompson().subset_construction()
+            for _ in range(200):
+                word = ''.join(rng.choice('abcxy') for _ in range(rng.randrange(7)))
+                self.assertEqual(nfa.accept(word), dfa.accept(word), (regex_str, word))
+
+    def test_compile_followpos(self):
+        regex = parse_regex('(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)')
+        # the position NFA is only built for the fallback
+        with patch.object(Regex, 'glushkov', side_effect=AssertionError('NFA built')):
+            matcher = regex.compile(method='followpos')
+        self.assertIsInstance(matcher, DFAMatcher)
+        self.assertTrue(matcher.accept('ba' + 'b' * 8))
+        self.assertIsInstance(regex.compile(max_states=50, method='followpos'), NFASimulator)
+        self.assertIsInstance(regex.compile(max_states=50, method='glushkov'), NFASimulator)
+        with self.assertRaises(ValueError):
+            regex.compile(method='brzozowski')
+
+
+class SimplifierTests(unittest.TestCase):
+    def test_algebraic_rules(self):
+        for regex_str in ['a**', '(a?)*', '(a+)?', '(a*)+', 'a+*']:
+            simplified = parse_regex(regex_str).simplify()
+            self.assertIsInstance(simplified, Kleene)
+            self.assertIsInstance(simplified.reg, Character)
+        self.assertIsInstance(parse_regex('(a|a)').simplify(), Character)
+        self.assertIsInstance(parse_regex('a|').simplify(), Optional)
+
+    def test_single_characters_merge_into_a_class(self):
+        simplified = parse_regex('a|b|c|[x-z]').simplify()
+        self.assertIsInstance(simplified, CharClass)
+        self.assertEqual(simplified.chars, set('abcxyz'))
+        # a|[^ab] = [^b]
+        simplified = parse_regex('a|[^ab]').simplify()
+        self.assertIsInstance(simplified, CharClass)
+        self.assertTrue(simplified.negated)
+        self.assertEqual(simplified.chars, {'b'})
+
+    def test_common_prefixes_are_factored(self):
+        simplified = parse_regex('if|int|in').simplify()
+        # i(f|nt?): the i is read once
+        self.assertIsInstance(simplified, Concat)
+        self.assertEqual(simplified.left.c, 'i')
+        self.assertLess(len(simplified.thompson().K), len(parse_regex('if|int|in').thompson().K))
+        # a prefix longer than the recursion limit is factored in one piece
+        simplified = parse_regex('a' * 2000 + 'b|' + 'a' * 2000 + 'c').simplify()
+        # a^2000[bc]
+        self.assertEqual(len(chain_parts(simplified)), 2001)
+        self.assertIsInstance(chain_parts(simplified)[-1], CharClass)
+        self.assertEqual(simplified.compile().accept_many(['a' * 2000 + 'c', 'a' * 1999 + 'b']), [True, False])
+
+    def test_identical_subtrees_are_shared(self):
+        simplified = parse_regex('(ab)*c(ab)*').simplify()
+        self.assertIs(simplified.left, simplified.right.right)
+
+    def test_simplified_regex_is_equivalent(self):
+        rng = random.Random(0)
+        for regex_str in ['(ab|a)*b?', 'x(a|b)*|x', 'abc|abd|b', '[a-c]|d|e*', 'a?|b*|(ab)+|', '((a|)b)*']:
+            regex = parse_regex(regex_str)
+            dfa = regex.thompson().subset_construction()
+            simplified = regex.simplify().thompson().subset_construction()
+            for _ in range(300):
+                word = ''.join(rng.choice('abcdex') for _ in range(rng.randrange(7)))
+                self.assertEqual(simplified.accept(word), dfa.accept(word), (regex_str, word))
+
+
+class DerivativeTests(unittest.TestCase):
+    def test_derivatives_agree_with_dfa(self):
+        rng = random.Random(0)
+        for regex_str in ['(a|b)*abb', 'a*', '(ab|a)*b?', '[a-c]+x|y*', 'a?b?', '((a|)b)*', '(a*)*b']:
+            regex = parse_regex(regex_str)
+            matcher = regex.compile(method='derivatives')
+            self.assertIsInstance(matcher, DerivativeMatcher)
+            dfa = regex.thompson().subset_construction()
+            for _ in range(200):
+                word = ''.join(rng.choice('abcxy') for _ in range(rng.randrange(8)))
+                self.assertEqual(matcher.accept(word), dfa.accept(word), (regex_str, word))
+
+    def test_hash_consing(self):
+        table = TermTable()
+        a, b = table.chars('a'), table.chars('b')
+        self.assertEqual(table.alt(a, b), table.alt(b, a, a))
+        self.assertEqual(table.star(table.star(a)), table.star(a))
+        self.assertEqual(table.cat(table.cat(a, b), a), table.cat(a, table.cat(b, a)))
+        self.assertEqual(table.complement(table.complement(a)), a)
+        self.assertEqual(table.alt(a, table.empty), a)
+        self.assertEqual(table.cat(table.eps, a), a)
+
+    def test_states_are_built_lazily(self):
+        matcher = DerivativeMatcher.from_regex(parse_regex('(a|b)*a(a|b)(a|b)(a|b)(a|b)(a|b)(a|b)'))
+        self.assertEqual(matcher.states, 0)
+        self.assertTrue(matcher.accept('b' * 20 + 'a' + 'b' * 6))
+        # the minimal DFA has 2^7 states, one word only visits a few of them
+        self.assertLessEqual(matcher.states, 10)
+        self.assertEqual(matcher.match_prefix('xab' + 'a' * 6, 1), 8)
+
+    def test_intersection_and_complement(self):
+        words = DerivativeMatcher.from_regex(parse_regex('[a-z]+'))
+        ends_with_a = DerivativeMatcher.from_regex(parse_regex('(a|b)*a'))
+        matcher = words.intersection(ends_with_a.complement())
+        self.assertEqual(matcher.accept_many(['ab', 'ba', 'xyz', '']), [True, False, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()